@@ -1,23 +1,44 @@
-import mido
+import time
+_STARTUP_T0 = time.perf_counter()
+
 import os
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext, ttk
+from tkinter import filedialog, messagebox, ttk
 import customtkinter as ctk
 import traceback
 from collections import defaultdict
 import math
 import logging
-import time
 import threading
-import pygame
-import pygame.midi
 import queue
 
+import code_viewer
+import midi_core
+import midi_cache
+import midi_device
+import midi_incremental
+import midi_loader
+import midi_metrics
+import midi_playback
+import ui_channel
+
+# pygame and mido are imported on first use (playback, mido fallback), not at startup
+_IMPORTS_DONE = time.perf_counter()
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Workshop character set (128 characters)
-WORKSHOP_CHARSET = "0!@#$%^&*+ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyzΑΒΓΔΕΖΗΘΙΚΛΜαβγδεζηθικλμΝΞΟΠΡΣΤΥΦΧΨΩνξοπρστυφχψωÀÁÂÃÄÅÆÇÈÉÊËàáâãäå"
+# Interval at which worker updates are applied to the UI (~30 fps)
+UI_FRAME_MS = 33
+
+# Beat subdivisions offered for quantization
+QUANTIZE_SUBDIVISIONS = (2, 3, 4, 6, 8, 12, 16)
+
+# Quiet period after the last settings change before a live re-conversion starts
+LIVE_UPDATE_DELAY_MS = 250
+
+# Output menu entry that enumerates the MIDI ports (pygame.midi starts on first use)
+OUTPUT_REFRESH_CHOICE = "Refresh ports"
 
 class MidiConverterApp(ctk.CTk):
     def __init__(self):
@@ -32,6 +53,7 @@ class MidiConverterApp(ctk.CTk):
         ctk.set_default_color_theme("blue")
         
         # Initialize variables
+        self.scheduler = None
         self.shift_amount = 0
         self.selected_tracks = []
         self.bpm = 120
@@ -42,26 +64,57 @@ class MidiConverterApp(ctk.CTk):
         self.track_states = {}
         self.total_playback_time = 0.0
         self.midi_output = None
-        self.active_notes = {}
+        self.output_pool = midi_device.MidiOutputPool()
+        self.output_ports = {}
+        self.active_notes = midi_playback.ActiveNotes()
         self.track_channels = {}
         self.current_file = None
         self.raw_data = None
         self.compressed_data = None
-        self.compressed_floats = None
+        self.workshop_rule = None  # (rule_name, subroutine_id, bpm, encoding) of the last conversion
+        self.encoding = midi_core.ENCODING_FIXED
+        self.timing_errors = None  # quantization shifts (ms) of the last conversion, None when not quantized
         self.num_events = 0
         self.seeking = False
         self.current_playback_time = 0.0
         self.was_playing = False
         self.midi_loaded = False
-        self.all_events = []
         self.ticks_per_beat = 480
-        self.midi_data = None
+        self.song = None
+        self.loader = midi_loader.BackgroundLoader()
+        self.load_token = None
+        self.ui_channel = ui_channel.UpdateChannel()
+        self.playback_generation = 0
         self.stop_event = threading.Event()
         self.playback_lock = threading.Lock()
+        self.conversion_cache = self.init_conversion_cache()
+        self.incremental = None  # IncrementalConverter of the loaded song
+        self.live_ready = False  # live updates start after the first conversion of a file
+        self.live_update_job = None
+        self.live_generation = 0
         
         # Create UI
         self.create_widgets()
-        self.init_audio()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(UI_FRAME_MS, self.pump_ui)
+        self.after_idle(self.report_startup_time)
+        
+    def report_startup_time(self):
+        """Log how long it took to get the window up"""
+        now = time.perf_counter()
+        logging.info(f"Startup took {(now - _STARTUP_T0) * 1000:.0f} ms "
+                     f"(imports {(_IMPORTS_DONE - _STARTUP_T0) * 1000:.0f} ms, "
+                     f"window {(now - _IMPORTS_DONE) * 1000:.0f} ms)")
+    
+    def scan_output_ports(self, refresh=False):
+        """Enumerate MIDI output ports on a worker and fill the port menu; refresh picks up new devices"""
+        def run():
+            try:
+                self.ui_channel.post('output_ports', self.output_pool.list_outputs(refresh))
+            except Exception as e:
+                logging.error(f"Failed to enumerate MIDI outputs: {e}")
+        
+        threading.Thread(target=run, daemon=True).start()
         
     def create_widgets(self):
         # Set grid weights
@@ -140,6 +193,38 @@ class MidiConverterApp(ctk.CTk):
                                          command=lambda: self.change_subroutine_id(-1))
         self.btn_sub_down.pack(side="top", padx=(0, 0))
         
+        # Sheet encoding (compact and lz need a player that reads Event Player.SheetFormat)
+        ctk.CTkLabel(info_frame, text="Encoding:").grid(row=0, column=4, padx=(20, 5), pady=5, sticky="w")
+        self.encoding_var = tk.StringVar(value=midi_core.ENCODING_FIXED)
+        ctk.CTkOptionMenu(info_frame, variable=self.encoding_var, values=list(midi_core.ENCODING_IDS),
+                          width=100).grid(row=0, column=5, padx=5, pady=5, sticky="w")
+        
+        # Pack notes that start together into chord events
+        self.chords_var = tk.IntVar(value=0)
+        ctk.CTkCheckBox(info_frame, text="Chord Packing", variable=self.chords_var).grid(
+            row=0, column=6, padx=(20, 5), pady=5, sticky="w")
+        
+        # Snap notes to a beat grid, moving none by more than the error budget
+        ctk.CTkLabel(info_frame, text="Quantize:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        self.quantize_var = tk.StringVar(value="Off")
+        ctk.CTkOptionMenu(info_frame, variable=self.quantize_var,
+                          values=["Off"] + [f"1/{n} beat" for n in QUANTIZE_SUBDIVISIONS],
+                          width=100).grid(row=1, column=1, padx=5, pady=5, sticky="w")
+        
+        ctk.CTkLabel(info_frame, text="Max Error (ms):").grid(row=1, column=2, padx=(20, 5), pady=5, sticky="w")
+        self.entry_max_error = ctk.CTkEntry(info_frame, width=50, height=25)
+        self.entry_max_error.insert(0, str(midi_core.QUANTIZE_MAX_ERROR_MS))
+        self.entry_max_error.grid(row=1, column=3, padx=5, pady=5, sticky="w")
+        
+        # Re-convert in the background whenever a setting changes
+        self.live_var = tk.IntVar(value=1)
+        ctk.CTkCheckBox(info_frame, text="Live Update", variable=self.live_var).grid(
+            row=1, column=4, columnspan=2, padx=(20, 5), pady=5, sticky="w")
+        for var in (self.encoding_var, self.chords_var, self.quantize_var):
+            var.trace_add("write", self.schedule_live_update)
+        self.entry_max_error.bind("<KeyRelease>", self.schedule_live_update)
+        self.entry_subroutine.bind("<KeyRelease>", self.schedule_live_update)
+        
         # Track selection frame
         track_frame = ctk.CTkFrame(main_container)
         track_frame.grid(row=3, column=0, padx=0, pady=5, sticky="ew")
@@ -186,6 +271,14 @@ class MidiConverterApp(ctk.CTk):
         self.lbl_progress = ctk.CTkLabel(control_frame, text="0:00 / 0:00", width=80)
         self.lbl_progress.grid(row=0, column=4, padx=5, pady=5)
         
+        # MIDI output port; the ports are enumerated on the first playback or through the Refresh entry
+        self.output_var = tk.StringVar(value="Auto")
+        self.output_choice = "Auto"
+        self.output_menu = ctk.CTkOptionMenu(control_frame, variable=self.output_var,
+                                             values=["Auto", OUTPUT_REFRESH_CHOICE],
+                                             command=self.on_output_selected, width=160)
+        self.output_menu.grid(row=0, column=5, padx=5, pady=5)
+        
         # Function buttons frame
         func_frame = ctk.CTkFrame(main_container)
         func_frame.grid(row=5, column=0, padx=0, pady=5, sticky="ew")
@@ -217,7 +310,8 @@ class MidiConverterApp(ctk.CTk):
         workshop_frame = ctk.CTkFrame(self.tab_workshop)
         workshop_frame.pack(fill="both", expand=True, padx=5, pady=5)
         
-        self.workshop_code = scrolledtext.ScrolledText(workshop_frame, height=15, bg='#2b2b2b', fg='white')
+        # Paged viewer; the full code stays in memory for saving and copying
+        self.workshop_code = code_viewer.CodeViewer(workshop_frame, fg_color="transparent")
         self.workshop_code.pack(fill="both", expand=True)
         
         # Bottom buttons frame
@@ -234,9 +328,37 @@ class MidiConverterApp(ctk.CTk):
         self.btn_save_workshop.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         
         self.btn_exit = ctk.CTkButton(bottom_frame, text="Exit", 
-                                     command=self.destroy)
+                                     command=self.on_close)
         self.btn_exit.grid(row=0, column=2, padx=5, pady=5, sticky="ew")
         
+        # Status line: stage timings and playback statistics
+        self.lbl_status = ctk.CTkLabel(main_container, text="", anchor="w")
+        self.lbl_status.grid(row=8, column=0, padx=5, pady=(0, 5), sticky="ew")
+        
+    @property
+    def is_playing(self):
+        return self._is_playing
+    
+    @is_playing.setter
+    def is_playing(self, value):
+        self._is_playing = value
+        self.wake_playback()
+    
+    @property
+    def is_paused(self):
+        return self._is_paused
+    
+    @is_paused.setter
+    def is_paused(self, value):
+        self._is_paused = value
+        self.wake_playback()
+    
+    def wake_playback(self):
+        """Wake the playback scheduler so it reacts to a state change immediately"""
+        scheduler = getattr(self, 'scheduler', None)
+        if scheduler is not None:
+            scheduler.wake()
+    
     def change_subroutine_id(self, delta):
         """Change subroutine ID"""
         try:
@@ -250,15 +372,60 @@ class MidiConverterApp(ctk.CTk):
             self.entry_subroutine.delete(0, tk.END)
             self.entry_subroutine.insert(0, "50")
             self.subroutine_id = 50
+        self.schedule_live_update()
         
-    def init_audio(self):
-        """Initialize audio devices"""
+    def refresh_output_ports(self, outputs):
+        """Fill the output port menu from the device pool's [(device_id, name), ...]"""
+        self.output_ports = {f"{device_id}: {name}": device_id for device_id, name in outputs}
+        self.output_menu.configure(values=["Auto"] + list(self.output_ports) + [OUTPUT_REFRESH_CHOICE])
+    
+    def on_output_selected(self, choice):
+        """Switch playback to the chosen MIDI output port"""
+        if choice == OUTPUT_REFRESH_CHOICE:
+            self.output_var.set(self.output_choice)
+            # Restarting pygame.midi would close the port in use, so playback only re-lists
+            self.scan_output_ports(refresh=not self.is_playing)
+            return
+        self.output_choice = choice
+        
+        # Holding the pool lock keeps the playback thread from writing while the old port closes
+        with self.output_pool.lock:
+            if self.is_playing:
+                # Silence the old port before leaving it
+                messages = self.active_note_off_messages()
+                for channel in sorted(set(self.track_channels.values())):
+                    messages.append([[0xB0 + channel, 123, 0], 0])
+                try:
+                    self.send_messages(messages)
+                except Exception as e:
+                    logging.error(f"Failed to stop notes: {e}")
+
+            self.output_pool.select(self.output_ports.get(choice))
+            if self.is_playing:
+                self.midi_output = self.output_pool.get()
+                messages = []
+                for channel in sorted(set(self.track_channels.values())):
+                    messages.append([[0xB0 + channel, 7, 127], 0])  # Volume
+                    messages.append([[0xB0 + channel, 10, 64], 0])  # Pan
+                try:
+                    self.send_messages(messages)
+                except Exception as e:
+                    logging.error(f"Failed to set up MIDI output: {e}")
+    
+    def on_close(self):
+        """Close the MIDI port and exit"""
+        self.stop_event.set()
+        self.is_playing = False
+        self.output_pool.close()
+        self.destroy()
+            
+    def init_conversion_cache(self):
+        """Open the on-disk conversion cache"""
         try:
-            pygame.mixer.quit()
-            pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=1024)
-            pygame.midi.init()
-        except Exception as e:
-            logging.error(f"Error initializing audio devices: {e}")
+            return midi_cache.ConversionCache()
+        except OSError as e:
+            logging.error(f"Conversion cache disabled: {e}")
+            return None
             
     def set_shift(self, semitones):
         """Set pitch shift amount"""
@@ -271,8 +438,9 @@ class MidiConverterApp(ctk.CTk):
         value = int(self.slider_shift.get())
         self.shift_amount = value
         self.lbl_shift_value.configure(text=f"{value} Semitones")
+        self.schedule_live_update()
     
-    def create_track_checkboxes(self, tracks):
+    def create_track_checkboxes(self, track_names):
         """Create track checkboxes"""
         # Clear old checkboxes
         for widget in self.track_check_frame.winfo_children():
@@ -282,9 +450,9 @@ class MidiConverterApp(ctk.CTk):
         self.track_checkboxes = []
         
         # Create new checkboxes
-        for i, track in enumerate(tracks):
+        for i, name in enumerate(track_names):
             var = tk.IntVar(value=1)
-            track_name = track.name if track.name else f"Track{i+1}"
+            track_name = name if name else f"Track{i+1}"
             if len(track_name) > 10:
                 track_name = track_name[:8] + ".."
             
@@ -299,9 +467,11 @@ class MidiConverterApp(ctk.CTk):
     
     def on_track_state_changed(self, track_idx):
         """Track state changed"""
+        self.schedule_live_update()
         if hasattr(self, 'track_states') and self.is_playing and not self.is_paused:
             is_selected = self.track_vars[track_idx].get() == 1
             self.track_states[track_idx] = is_selected
+            self.wake_playback()
             
             if hasattr(self, 'midi_output') and self.midi_output:
                 try:
@@ -309,26 +479,37 @@ class MidiConverterApp(ctk.CTk):
                         channel = self.track_channels[track_idx]
                         if is_selected:
                             # Unmute
-                            self.midi_output.write_short(0xB0 + channel, 7, 127)
+                            self.send_messages([[[0xB0 + channel, 7, 127], 0]])
                         else:
-                            # Mute
-                            self.midi_output.write_short(0xB0 + channel, 7, 0)
-                            # Stop current notes
-                            self.stop_all_notes_for_track(track_idx)
+                            # Mute and stop current notes in one write
+                            self.stop_all_notes_for_track(track_idx, [[[0xB0 + channel, 7, 0], 0]])
                 except Exception as e:
                     logging.error(f"Failed to set track{track_idx} mute state: {e}")
     
-    def stop_all_notes_for_track(self, track_idx):
-        """Stop all notes for specified track"""
-        if hasattr(self, 'active_notes') and track_idx in self.active_notes:
-            for note in self.active_notes[track_idx]:
-                try:
-                    if hasattr(self, 'midi_output') and self.midi_output:
-                        channel = self.track_channels[track_idx]
-                        self.midi_output.note_off(note, 0, channel)
-                except:
-                    pass
-            self.active_notes[track_idx] = []
+    def stop_all_notes_for_track(self, track_idx, messages=None):
+        """Stop the sounding notes of specified track, sent after messages in one write"""
+        messages = list(messages or [])
+        channel = self.track_channels[track_idx]
+        for note in self.active_notes.pop_track(track_idx):
+            messages.append([[0x80 + channel, note, 0], 0])
+        self.send_messages(messages)
+    
+    def active_note_off_messages(self):
+        """Note off messages for every sounding note, which are forgotten"""
+        messages = []
+        for track_idx, notes in self.active_notes.pop_all().items():
+            channel = self.track_channels.get(track_idx, 0)
+            messages.extend([[0x80 + channel, note, 0], 0] for note in notes)
+        return messages
+    
+    def send_messages(self, messages):
+        """Write [[status, data1, data2], timestamp] messages to the MIDI output"""
+        with self.output_pool.lock:
+            if not self.midi_output:
+                return
+            # pygame.midi accepts at most 1024 messages per write
+            for j in range(0, len(messages), 1024):
+                self.midi_output.write(messages[j:j + 1024])
     
     def toggle_select_all(self):
         """Toggle select all/none"""
@@ -362,90 +543,116 @@ class MidiConverterApp(ctk.CTk):
             self.progress_slider.set(0)
             self.lbl_progress.configure(text="0:00 / 0:00")
             self.midi_loaded = False
+            self.song = None
+            self.live_ready = False
+            self.incremental = None
+            self.btn_convert_compress.configure(state="disabled")
+            self.btn_play.configure(state="disabled")
             
-            try:
-                # Load MIDI file
-                self.midi_data = mido.MidiFile(filepath)
-                
-                # Create track selection
-                self.create_track_checkboxes(self.midi_data.tracks)
-                
-                # Initialize track states
-                self.track_states = {i: True for i in range(len(self.midi_data.tracks))}
-                
-                # Get BPM
-                self.bpm = self.get_bpm_from_midi(self.midi_data)
-                self.lbl_bpm.configure(text=str(self.bpm))
-                
-                # Calculate total duration
-                self.total_playback_time = self.calculate_midi_duration(self.midi_data)
-                self.ticks_per_beat = self.midi_data.ticks_per_beat
-                
-                # Mark MIDI as loaded
-                self.midi_loaded = True
-                
-                # Enable buttons
-                self.btn_convert_compress.configure(state="normal")
-                self.btn_play.configure(state="normal")
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load MIDI file:\n{str(e)}")
-                self.btn_convert_compress.configure(state="disabled")
-                self.btn_play.configure(state="disabled")
-    
-    def get_bpm_from_midi(self, mid):
-        """Get BPM value from MIDI file"""
-        default_bpm = 120
-        tempo = 500000
-        
-        for track in mid.tracks:
-            for msg in track:
-                if msg.type == 'set_tempo':
-                    tempo = msg.tempo
-                    break
-            if tempo != 500000:
-                break
-        
-        bpm = round(60000000 / tempo)
-        return bpm if bpm > 0 else default_bpm
+            # Parse on a worker; a newer selection cancels this one
+            self.load_token = self.loader.start(filepath)
+            self.lbl_progress.configure(text="Loading...")
     
-    def calculate_midi_duration(self, mid):
-        """Calculate MIDI file total duration"""
+    def pump_ui(self):
+        """Apply worker updates on the Tk thread, once per frame"""
         try:
-            total_time = mid.length
+            latest, events = self.ui_channel.drain()
+            
+            for event in events:
+                if event[0] == 'playback_finished':
+                    # Ignore playbacks that were already replaced by a seek or restart
+                    if event[1] == self.playback_generation and self.is_playing:
+                        self.stop_playback()
+                elif event[0] == 'output_ports':
+                    self.refresh_output_ports(event[1])
+                elif event[0] == 'warning':
+                    messagebox.showwarning(event[1], event[2])
             
-            if total_time > 36000:
-                total_time = self.calculate_duration_manually(mid)
+            if 'position' in latest and self.is_playing:
+                self.current_playback_time = latest['position']
+                self.update_progress_label()
             
-            if total_time > 86400:
-                total_time = 3600
+            if 'playback_stats' in latest:
+                self.show_playback_stats(latest['playback_stats'])
             
-            return total_time
+            if 'live_result' in latest:
+                self.on_live_result(*latest['live_result'])
             
+            self.drain_loader()
         except Exception as e:
-            logging.error(f"Error calculating MIDI duration: {e}")
-            return 300
+            logging.error(f"UI update failed: {e}\n{traceback.format_exc()}")
+        
+        self.after(UI_FRAME_MS, self.pump_ui)
     
-    def calculate_duration_manually(self, mid):
-        """Manually calculate MIDI file duration"""
-        try:
-            total_ticks = 0
-            for track in mid.tracks:
-                track_ticks = 0
-                for msg in track:
-                    track_ticks += msg.time
-                if track_ticks > total_ticks:
-                    total_ticks = track_ticks
-            
-            tempo = 500000
-            ticks_per_beat = mid.ticks_per_beat
-            
-            total_time = mido.tick2second(total_ticks, ticks_per_beat, tempo)
+    def drain_loader(self):
+        """Apply file loader messages, showing only the latest progress"""
+        progress = None
+        while True:
+            try:
+                message = self.loader.messages.get_nowait()
+            except queue.Empty:
+                break
             
-            return total_time
+            kind, token = message[0], message[1]
+            if token != self.load_token:
+                continue
             
-        except:
-            return 300
+            if kind == 'progress':
+                progress = message[2:]
+            elif kind == 'done':
+                progress = None
+                self.on_file_loaded(message[2])
+            elif kind == 'error':
+                progress = None
+                self.lbl_progress.configure(text="0:00 / 0:00")
+                messagebox.showerror("Error", f"Failed to load MIDI file:\n{str(message[2])}")
+        
+        if progress is not None:
+            bytes_read, total_bytes, tracks_read, num_tracks = progress
+            percent = 100 * bytes_read // total_bytes if total_bytes else 0
+            self.lbl_progress.configure(text=f"Loading {percent}% ({tracks_read}/{num_tracks} tracks)")
+    
+    def show_status(self, text):
+        """Show text in the status line"""
+        self.lbl_status.configure(text=text)
+    
+    def show_playback_stats(self, stats):
+        """Show playback scheduler statistics in the status line"""
+        self.show_status(f"Playback: {stats['events_sent']} events sent, {stats['late_events']} late "
+                         f"(max {stats['max_lateness_ms']:.1f} ms), {stats['wakeups']} wakeups")
+    
+    def on_file_loaded(self, info):
+        """Update widgets for a finished load"""
+        self.show_status(midi_metrics.format_records(info.metrics))
+        # Load MIDI file once; playback, seeking and conversion share it
+        self.song = info.song
+        
+        # Live updates reuse per-track work, but only after this file's first conversion
+        self.cancel_live_update()
+        self.live_ready = False
+        self.incremental = midi_incremental.IncrementalConverter(self.song, info.path)
+        
+        # Create track selection
+        self.create_track_checkboxes(info.track_names)
+        
+        # Initialize track states
+        self.track_states = {i: True for i in range(len(self.song.tracks))}
+        
+        # Get BPM
+        self.bpm = info.bpm
+        self.lbl_bpm.configure(text=str(self.bpm))
+        
+        # Calculate total duration
+        self.total_playback_time = info.duration
+        self.ticks_per_beat = self.song.ticks_per_beat
+        self.update_progress_label()
+        
+        # Mark MIDI as loaded
+        self.midi_loaded = True
+        
+        # Enable buttons
+        self.btn_convert_compress.configure(state="normal")
+        self.btn_play.configure(state="normal")
     
     def format_time(self, seconds):
         """Format time display"""
@@ -559,98 +766,51 @@ class MidiConverterApp(ctk.CTk):
         self.is_playing = True
         self.is_paused = False
         self.stop_event.clear()
+        self.playback_generation += 1
         
         self.playback_thread = threading.Thread(target=self._play_midi_safe, 
-                                              args=(selected_track_indices,),
+                                              args=(selected_track_indices, self.playback_generation),
                                               daemon=True)
         self.playback_thread.start()
     
-    def _play_midi_safe(self, selected_track_indices):
-        """Safe MIDI playback function"""
+    def _play_midi_safe(self, selected_track_indices, generation):
+        """Safe MIDI playback function; runs on the playback thread and reports through ui_channel"""
         try:
-            # Load MIDI file
-            mid = mido.MidiFile(self.current_file)
+            song = self.song
             
-            # Reinitialize MIDI devices
-            try:
-                pygame.midi.quit()
-                pygame.midi.init()
-                
-                # Try to get MIDI output device
-                output_id = None
-                for i in range(pygame.midi.get_count()):
-                    info = pygame.midi.get_device_info(i)
-                    if info and info[2] == 1:  # Output device
-                        try:
-                            self.midi_output = pygame.midi.Output(i)
-                            output_id = i
-                            break
-                        except:
-                            continue
-                
-                if output_id is None:
-                    # Try using default device
-                    try:
-                        self.midi_output = pygame.midi.Output(0)
-                    except Exception as e:
-                        # If no device found, use virtual device
-                        self.after(0, lambda: messagebox.showwarning("MIDI Warning", 
-                            "No MIDI output device found, using virtual device for playback.\n"
-                            "To hear sound, ensure system has MIDI synthesizer installed."))
-                        # Continue execution but may have no sound
-                        self.midi_output = None
-                        
-            except Exception as e:
-                logging.error(f"Failed to initialize MIDI devices: {e}")
-                self.midi_output = None
-            
-            # Collect all MIDI events
-            all_events = []
-            current_tempo = 500000
-            ticks_per_beat = mid.ticks_per_beat
-            
-            for track_idx, track in enumerate(mid.tracks):
-                if track_idx not in selected_track_indices:
-                    continue
-                    
-                current_tick = 0
-                for msg in track:
-                    current_tick += msg.time
-                    
-                    if msg.type == 'set_tempo':
-                        current_tempo = msg.tempo
-                    
-                    if msg.type in ['note_on', 'note_off']:
-                        all_events.append((current_tick, msg, track_idx, current_tempo))
+            # Reuse the session's MIDI output port (pygame.midi starts on the first playback)
+            self.midi_output = self.output_pool.get()
+            self.ui_channel.post('output_ports', self.output_pool.list_outputs())
+            if self.midi_output is None:
+                self.ui_channel.post('warning', "MIDI Warning",
+                    "No MIDI output device found, using virtual device for playback.\n"
+                    "To hear sound, ensure system has MIDI synthesizer installed.")
             
-            # Sort by time
-            all_events.sort(key=lambda x: x[0])
+            # Merged note timeline of the selected tracks (memoized on the song)
+            timeline = song.timeline(selected_track_indices)
             
-            if not all_events:
-                self.after(0, self.stop_playback)
+            if len(timeline) == 0:
+                self.ui_channel.post('playback_finished', generation)
                 return
             
+            event_times = timeline.seconds.tolist()
+            event_notes = timeline.notes.tolist()
+            event_velocities = timeline.velocities.tolist()
+            event_is_on = timeline.is_on.tolist()
+            event_tracks = timeline.tracks.tolist()
+            
             # Calculate total time
-            max_tick = all_events[-1][0]
-            self.total_playback_time = mido.tick2second(max_tick, ticks_per_beat, 500000)
+            self.total_playback_time = event_times[-1]
             
-            # Adjust starting position based on current progress
-            start_index = 0
-            if self.current_playback_time > 0:
-                for i, (tick, msg, track_idx, tempo) in enumerate(all_events):
-                    event_time = mido.tick2second(tick, ticks_per_beat, tempo)
-                    if event_time >= self.current_playback_time:
-                        start_index = i
-                        break
+            # Release notes left sounding by a seek before remapping channels
+            self.send_messages(self.active_note_off_messages())
             
             # Initialize track channels
             self.track_channels = {}
-            self.active_notes = {}
             
             channel = 0
             for track_idx in selected_track_indices:
                 self.track_channels[track_idx] = channel
-                self.active_notes[track_idx] = []
                 
                 if self.midi_output:
                     try:
@@ -664,101 +824,84 @@ class MidiConverterApp(ctk.CTk):
                 if channel >= 16:  # MIDI has only 16 channels
                     channel = 0
             
-            # Start playback
-            start_time = time.time() - self.current_playback_time
-            last_update_time = time.time()
-            event_index = start_index
-            
-            while self.is_playing and event_index < len(all_events) and not self.stop_event.is_set():
-                if self.is_paused:
-                    time.sleep(0.1)
-                    continue
+            def dispatch(start, end):
+                """Send all due events as one batch"""
+                # Under the pool lock so the output port cannot be switched mid-batch
+                with self.output_pool.lock:
+                    if not self.midi_output:
+                        return
                 
-                current_time = time.time() - start_time
-                
-                # Process all events that should occur at this time point
-                while (event_index < len(all_events) and 
-                       mido.tick2second(all_events[event_index][0], ticks_per_beat, all_events[event_index][3]) <= current_time):
-                    
-                    tick, msg, track_idx, tempo = all_events[event_index]
+                    batch = []
+                    for i in range(start, end):
+                        track_idx = event_tracks[i]
+                        if not self.track_states.get(track_idx, True):
+                            continue
                     
-                    if self.track_states.get(track_idx, True):
-                        try:
-                            if self.midi_output:
-                                if msg.type == 'note_on' and msg.velocity > 0:
-                                    # Apply pitch shift
-                                    note = msg.note + self.shift_amount
-                                    if note < 0:
-                                        note = 0
-                                    elif note > 127:
-                                        note = 127
-                                    
-                                    channel = self.track_channels[track_idx]
-                                    self.midi_output.note_on(note, msg.velocity, channel)
-                                    self.active_notes[track_idx].append(note)
-                                    
-                                elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
-                                    # Apply pitch shift
-                                    note = msg.note + self.shift_amount
-                                    if note < 0:
-                                        note = 0
-                                    elif note > 127:
-                                        note = 127
-                                    
-                                    channel = self.track_channels[track_idx]
-                                    self.midi_output.note_off(note, 0, channel)
-                                    if note in self.active_notes[track_idx]:
-                                        self.active_notes[track_idx].remove(note)
-                        except Exception as e:
-                            logging.error(f"Failed to send MIDI message: {e}")
+                        # Apply pitch shift
+                        note = event_notes[i] + self.shift_amount
+                        if note < 0:
+                            note = 0
+                        elif note > 127:
+                            note = 127
                     
-                    event_index += 1
-                
-                # Update progress
-                if time.time() - last_update_time >= 0.1:
-                    self.current_playback_time = current_time
-                    self.after(0, self.update_progress_label)
-                    last_update_time = time.time()
+                        channel = self.track_channels[track_idx]
+                        if event_is_on[i]:
+                            batch.append([[0x90 + channel, note, event_velocities[i]], 0])
+                            self.active_notes.note_on(track_idx, note)
+                        else:
+                            batch.append([[0x80 + channel, note, 0], 0])
+                            self.active_notes.note_off(track_idx, note)
                 
-                time.sleep(0.001)
+                    try:
+                        self.send_messages(batch)
+                    except Exception as e:
+                        logging.error(f"Failed to send MIDI message: {e}")
+                        # Reconnect on the next playback
+                        self.output_pool.invalidate()
+                        self.midi_output = None
+            
+            def on_progress(position):
+                self.ui_channel.publish('position', position)
+                self.ui_channel.publish('playback_stats', self.scheduler.stats())
+            
+            # Start playback
+            self.scheduler = midi_playback.PlaybackScheduler(
+                event_times, dispatch,
+                is_paused=lambda: self.is_paused,
+                is_stopped=lambda: not self.is_playing or self.stop_event.is_set(),
+                on_progress=on_progress)
             
             # Playback complete
-            if not self.stop_event.is_set():
-                self.after(0, self.stop_playback)
+            completed = self.scheduler.run(self.current_playback_time)
+            stats = self.scheduler.stats()
+            midi_metrics.record('playback', **stats)
+            self.ui_channel.publish('playback_stats', stats)
+            if completed:
+                self.ui_channel.post('playback_finished', generation)
             
         except Exception as e:
             logging.error(f"Playback failed: {e}\n{traceback.format_exc()}")
-            self.after(0, self.stop_playback)
+            self.ui_channel.post('playback_finished', generation)
     
     def stop_playback(self):
         """Stop playback"""
+        self.stop_event.set()
         self.is_playing = False
         self.is_paused = False
-        self.stop_event.set()
-        
-        # Stop all notes
-        if hasattr(self, 'midi_output') and self.midi_output:
-            try:
-                # Send all note off messages
-                for channel in range(16):
-                    for note in range(128):
-                        try:
-                            self.midi_output.note_off(note, 0, channel)
-                        except:
-                            pass
-            except:
-                pass
-            
-            try:
-                self.midi_output.close()
-                self.midi_output = None
-            except:
-                pass
         
         # Wait for playback thread to end
         if self.playback_thread and self.playback_thread.is_alive():
             self.playback_thread.join(timeout=0.5)
         
+        # Stop the sounding notes, then All Notes Off on every channel in use
+        messages = self.active_note_off_messages()
+        for channel in sorted(set(self.track_channels.values())):
+            messages.append([[0xB0 + channel, 123, 0], 0])
+        try:
+            self.send_messages(messages)
+        except Exception as e:
+            logging.error(f"Failed to stop notes: {e}")
+        
         # Reset progress
         self.current_playback_time = 0.0
         self.progress_slider.set(0)
@@ -789,8 +932,6 @@ class MidiConverterApp(ctk.CTk):
                 self.entry_subroutine.delete(0, tk.END)
                 self.entry_subroutine.insert(0, "50")
             
-            mid = mido.MidiFile(self.current_file)
-            
             # Get selected tracks
             self.selected_tracks = []
             if hasattr(self, 'track_vars'):
@@ -799,195 +940,156 @@ class MidiConverterApp(ctk.CTk):
                         self.selected_tracks.append(i)
             
             if not self.selected_tracks:
-                self.selected_tracks = list(range(len(mid.tracks)))
+                self.selected_tracks = list(range(len(self.song.tracks)))
             
-            # Step 1: Convert MIDI to keyboard events
-            converted_data = self.convert_to_keyboard(mid)
-            self.raw_data = converted_data
-            self.num_events = len(converted_data)
+            encoding = self.encoding_var.get()
+            chords = self.chords_var.get() == 1
             
-            # Statistics
-            num_notes = len([e for e in converted_data if '.' in e])
-            num_rests = len([e for e in converted_data if '.' not in e])
+            # Quantization settings
+            quantize_text = self.quantize_var.get()
+            quantize = 0 if quantize_text == "Off" else int(quantize_text.split()[0].split('/')[1])
+            try:
+                max_error_ms = float(self.entry_max_error.get())
+            except ValueError:
+                messagebox.showwarning("Warning", "Max error must be a number, reset to "
+                                                  f"{midi_core.QUANTIZE_MAX_ERROR_MS}")
+                max_error_ms = midi_core.QUANTIZE_MAX_ERROR_MS
+                self.entry_max_error.delete(0, tk.END)
+                self.entry_max_error.insert(0, str(max_error_ms))
             
-            # Step 2: Compress the data
-            float_list = []
-            for event in converted_data:
-                if '.' in event:
-                    key, duration = event.split('.')
-                    float_val = float(f"{key}.{duration}")
-                    float_list.append(float_val)
-                else:
-                    float_list.append(float(event))
+            # A pending or running live update would overwrite this result with older settings
+            self.cancel_live_update()
             
-            # Compress sequence
-            compressed_strings, debug_info = self.compress_sequence(float_list)
+            with midi_metrics.collect() as metrics:
+                # Convert, compress and generate workshop code (reused from cache when unchanged)
+                result, cache_hit = midi_cache.cached_convert_file(self.current_file, self.shift_amount,
+                                                                   self.selected_tracks, self.subroutine_id,
+                                                                   cache=self.conversion_cache, song=self.song,
+                                                                   encoding=encoding, chords=chords,
+                                                                   quantize=quantize, max_error_ms=max_error_ms)
+                self.apply_conversion(result, self.subroutine_id, encoding, quantize)
+            self.show_status(midi_metrics.format_records(metrics))
+            self.live_ready = True
             
-            # Generate workshop code
-            self.generate_workshop_code(compressed_strings)
+            converted_data = result['raw_data']
+            compressed_strings = result['compressed_strings']
             
-            # Enable buttons
-            self.btn_save.configure(state="normal")
-            self.btn_save_workshop.configure(state="normal")
-            self.btn_verify.configure(state="normal")
+            # Statistics
+            num_notes, num_rests = midi_core.count_events(converted_data)
             
-            # Save compressed data
-            self.compressed_data = compressed_strings
-            self.compressed_floats = float_list
+            # Size compared with the fixed encoding
+            size_text = f"Compressed to {len(compressed_strings)} strings"
+            if self.encoding != midi_core.ENCODING_FIXED:
+                report = midi_core.size_report(midi_core.events_to_values(converted_data),
+                                               (midi_core.ENCODING_FIXED, self.encoding))
+                size_text = f"{self.encoding.capitalize()} encoding: {midi_core.format_size_report(report, self.encoding)}"
             
             # Show success message
             messagebox.showinfo("Success", f"Conversion and compression completed successfully!\n"
                                          f"Total events: {len(converted_data)}\n"
                                          f"Note events: {num_notes}\n"
                                          f"Rest events: {num_rests}\n"
-                                         f"Compressed to {len(compressed_strings)} strings")
+                                         f"{size_text}"
+                                         f"{' (cached)' if cache_hit else ''}")
             
         except Exception as e:
             error_msg = f"Error during conversion and compression:\n{str(e)}\n\n{traceback.format_exc()}"
             messagebox.showerror("Conversion Error", error_msg)
     
-    def convert_to_keyboard(self, mid):
-        """Convert MIDI to keyboard events"""
-        events = []
-        tempo = 500000
-        current_abs_tick = 0
-        ticks_per_beat = mid.ticks_per_beat
-        
-        for track_index, track in enumerate(mid.tracks):
-            if track_index not in self.selected_tracks:
-                continue
-                
-            current_abs_tick = 0
-            for msg in track:
-                current_abs_tick += msg.time
-                
-                if msg.type == 'set_tempo':
-                    tempo = msg.tempo
-                
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    events.append((current_abs_tick, "note_on", msg.note))
-                
-                if msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
-                    events.append((current_abs_tick, "note_off", msg.note))
-        
-        events.sort(key=lambda x: x[0])
-        
-        timed_events = []
-        for abs_tick, event_type, note in events:
-            seconds = mido.tick2second(abs_tick, ticks_per_beat, tempo)
-            note += self.shift_amount
-            if note < 36:
-                note = 36
-            if note > 100:
-                note = 100
-            timed_events.append((seconds, event_type, note))
-        
-        active_notes = {}
-        notes_to_play = []
-        
-        max_event_time = max(timed_events, key=lambda x: x[0])[0] if timed_events else 0.0
-        for time, event_type, note in timed_events:
-            if event_type == "note_on":
-                if note in active_notes:
-                    start_time, _ = active_notes[note]
-                    notes_to_play.append((start_time, time, note))
-                active_notes[note] = (time, None)
-            elif event_type == "note_off":
-                if note in active_notes:
-                    start_time, _ = active_notes[note]
-                    notes_to_play.append((start_time, time, note))
-                    del active_notes[note]
-        
-        for note, (start_time, _) in active_notes.items():
-            notes_to_play.append((start_time, max_event_time, note))
-        
-        result = []
-        events_to_emit = []
-        
-        for start, end, note in notes_to_play:
-            duration = end - start
-            events_to_emit.append((start, "note_start", note, duration))
-        
-        events_to_emit.sort(key=lambda x: x[0])
-        
-        last_time = 0.0
-        max_time = events_to_emit[-1][0] if events_to_emit else 0.0
-        
-        if events_to_emit:
-            first_time = events_to_emit[0][0]
-            if first_time > 0:
-                silence_ms = int(first_time * 1000)
-                result.append(str(-silence_ms))
-                last_time = first_time
-        
-        for time, event_type, note, duration in events_to_emit:
-            if time > last_time:
-                gap_ms = int((time - last_time) * 1000)
-                if gap_ms > 0:
-                    result.append(str(-gap_ms))
-            
-            key_num = note - 35
-            duration_ms = int(duration * 1000)
-            result.append(f"{key_num}.{duration_ms}")
-            last_time = time
-        
-        if last_time < max_time:
-            final_silence = int((max_time - last_time) * 1000)
-            result.append(str(-final_silence))
-
-        for _ in range(2):
-            result.append("0.1")
-
-        return result
+    def apply_conversion(self, result, subroutine_id, encoding, quantize):
+        """Show a conversion result and keep it for saving and verification"""
+        self.raw_data = result['raw_data']
+        self.num_events = len(self.raw_data)
+        
+        # Show workshop code
+        with midi_metrics.span('display'):
+            self.show_workshop_code(result['workshop_code'])
+            self.update_idletasks()
+        
+        # Enable buttons
+        self.btn_save.configure(state="normal")
+        self.btn_save_workshop.configure(state="normal")
+        self.btn_verify.configure(state="normal")
+        
+        # Save compressed data and the rule settings used for it
+        self.compressed_data = result['compressed_strings']
+        self.encoding = encoding
+        self.timing_errors = result['timing_errors_ms'] if quantize else None
+        self.workshop_rule = (os.path.splitext(os.path.basename(self.current_file))[0],
+                              subroutine_id, result['bpm'], self.encoding)
     
-    def compress_sequence(self, sequence):
-        """Compress sequence"""
-        compressed_strings = []
-        debug_info = []
-        current_string = ""
-        
-        for value in sequence:
-            scaled_value = int(value * 100)
-            
-            if scaled_value < 0:
-                scaled_value = scaled_value + 2097152
-                if scaled_value < 1048576:
-                    scaled_value = 1048576
-                elif scaled_value > 2097151:
-                    scaled_value = 2097151
-            elif scaled_value > 1048575:
-                scaled_value = 1048575
-            
-            digits = []
-            num = scaled_value
-            
-            if num == 0:
-                digits = [0]
-            else:
-                while num > 0:
-                    digit = num % 128
-                    digits.append(digit)
-                    num = num // 128
-            
-            digits.reverse()
-            component_chars = [WORKSHOP_CHARSET[d] for d in digits]
-            component_str = ''.join(component_chars)
-            
-            if len(component_str) < 3:
-                component_str = WORKSHOP_CHARSET[0] * (3 - len(component_str)) + component_str
-            
-            debug_info.append((value, scaled_value, component_str))
-            
-            if len(current_string) + len(component_str) <= 128:
-                current_string += component_str
-            else:
-                compressed_strings.append(current_string)
-                current_string = component_str
+    def live_settings(self):
+        """Current conversion settings, read without prompting; invalid entries fall back to defaults"""
+        try:
+            subroutine_id = int(self.entry_subroutine.get())
+            if not 1 <= subroutine_id <= 99:
+                subroutine_id = 50
+        except ValueError:
+            subroutine_id = 50
         
-        if current_string:
-            compressed_strings.append(current_string)
+        selected_tracks = [i for i, var in enumerate(getattr(self, 'track_vars', [])) if var.get() == 1]
+        if not selected_tracks:
+            selected_tracks = list(range(len(self.song.tracks)))
         
-        return compressed_strings, debug_info
+        quantize_text = self.quantize_var.get()
+        quantize = 0 if quantize_text == "Off" else int(quantize_text.split()[0].split('/')[1])
+        try:
+            max_error_ms = float(self.entry_max_error.get())
+        except ValueError:
+            max_error_ms = midi_core.QUANTIZE_MAX_ERROR_MS
+        
+        return {'shift_amount': self.shift_amount, 'selected_tracks': selected_tracks,
+                'subroutine_id': subroutine_id, 'encoding': self.encoding_var.get(),
+                'chords': self.chords_var.get() == 1, 'quantize': quantize, 'max_error_ms': max_error_ms}
+    
+    def schedule_live_update(self, *args):
+        """Re-convert shortly after the settings stop changing, once the file has been converted"""
+        if not (self.live_ready and self.incremental is not None and self.live_var.get() == 1):
+            return
+        if self.live_update_job is not None:
+            self.after_cancel(self.live_update_job)
+        self.live_update_job = self.after(LIVE_UPDATE_DELAY_MS, self.start_live_update)
+    
+    def cancel_live_update(self):
+        """Drop the pending live update and any result still being computed"""
+        if self.live_update_job is not None:
+            self.after_cancel(self.live_update_job)
+            self.live_update_job = None
+        self.live_generation += 1
+    
+    def start_live_update(self):
+        """Re-convert with the current settings on a worker thread"""
+        self.live_update_job = None
+        if self.incremental is None:
+            return
+        self.live_generation += 1
+        generation = self.live_generation
+        settings = self.live_settings()
+        converter = self.incremental
+        
+        def run():
+            try:
+                with midi_metrics.collect() as metrics:
+                    with midi_metrics.span('live_update'):
+                        result = converter.convert(**settings)
+            except Exception as e:
+                logging.error(f"Live update failed: {e}\n{traceback.format_exc()}")
+                return
+            self.ui_channel.publish('live_result', (generation, settings, result, metrics))
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def on_live_result(self, generation, settings, result, metrics):
+        """Show a finished live update unless newer settings or another file replaced it"""
+        if generation != self.live_generation or not self.live_ready:
+            return
+        self.shift_amount = settings['shift_amount']
+        self.selected_tracks = settings['selected_tracks']
+        self.subroutine_id = settings['subroutine_id']
+        self.apply_conversion(result, settings['subroutine_id'], settings['encoding'], settings['quantize'])
+        self.show_status(f"Live update: {result['num_events']} events, "
+                         f"{len(result['compressed_strings'])} strings | "
+                         f"{midi_metrics.format_records(metrics)}")
     
     def verify_decompression(self):
         """Verify decompression"""
@@ -996,131 +1098,40 @@ class MidiConverterApp(ctk.CTk):
             return
         
         try:
-            decompressed_events = self.decompress_events_fixed(self.compressed_data, len(self.raw_data))
-            
-            match_count = 0
-            diff_positions = []
-            compare_limit = min(len(self.raw_data), len(decompressed_events))
-            
-            for i in range(compare_limit):
-                original = self.raw_data[i]
-                decompressed = decompressed_events[i]
-                
-                if '.' in original and '.' in decompressed:
-                    try:
-                        orig_key, orig_ms = original.split('.')
-                        dec_key, dec_ms = decompressed.split('.')
-                        
-                        if orig_key == dec_key and abs(int(orig_ms) - int(dec_ms)) < 10:
-                            match_count += 1
-                        else:
-                            diff_positions.append(i)
-                    except:
-                        diff_positions.append(i)
-                elif '.' not in original and '.' not in decompressed:
-                    try:
-                        # Fix negative number comparison
-                        orig_int = int(original)
-                        dec_int = int(decompressed)
-                        
-                        if abs(orig_int - dec_int) < 10:
-                            match_count += 1
-                        else:
-                            diff_positions.append(i)
-                    except:
-                        diff_positions.append(i)
-                else:
-                    diff_positions.append(i)
+            with midi_metrics.collect() as metrics:
+                with midi_metrics.span('decompress'):
+                    decompressed_events = midi_core.decode_events(self.compressed_data, len(self.raw_data),
+                                                                  self.encoding)
+                with midi_metrics.span('verify'):
+                    match_count, diff_positions, compare_limit = midi_core.compare_events(self.raw_data,
+                                                                                          decompressed_events)
+                    decode_errors = midi_core.timing_errors(self.raw_data, decompressed_events)
+            self.show_status(midi_metrics.format_records(metrics))
             
             match_rate = match_count / compare_limit if compare_limit > 0 else 0
             
+            # Timing error distributions: sheet encoding, and the beat-grid snapping before it
+            decode_distribution = midi_core.error_distribution(decode_errors)
+            error_text = f"Decode timing error: {midi_core.format_error_distribution(decode_distribution)}"
+            if self.timing_errors is not None:
+                quantize_distribution = midi_core.error_distribution(self.timing_errors)
+                error_text += f"\nQuantization error: {midi_core.format_error_distribution(quantize_distribution)}"
+            
             if match_rate >= 0.95:
-                messagebox.showinfo("Verification Success", f"Match rate: {match_rate:.2%}")
+                messagebox.showinfo("Verification Success", f"Match rate: {match_rate:.2%}\n{error_text}")
             else:
                 messagebox.showwarning("Verification Warning", f"Low match rate: {match_rate:.2%}\n"
-                                                               f"Difference positions: {diff_positions[:10]}")
+                                                               f"Difference positions: {diff_positions[:10].tolist()}\n"
+                                                               f"{error_text}")
                 
         except Exception as e:
             error_msg = f"Error during decompression verification:\n{str(e)}\n\n{traceback.format_exc()}"
             logging.error(error_msg)
             messagebox.showerror("Verification Error", error_msg)
     
-    def decompress_events_fixed(self, compressed_data, num_events):
-        """Decompress events - fixed negative number handling"""
-        combined = ''.join(compressed_data)
-        
-        chunk_size = 3
-        chunks = [combined[i:i+chunk_size] for i in range(0, min(len(combined), num_events * chunk_size), chunk_size)]
-        
-        processed_values = []
-        for chunk in chunks:
-            value = 0
-            for char in chunk:
-                idx = WORKSHOP_CHARSET.index(char) if char in WORKSHOP_CHARSET else 0
-                value = value * 128 + idx
-            
-            # Fix negative number handling logic
-            if value >= 1048576:
-                # This is a negative number, need to subtract offset
-                value = (value - 2097152) / 100.0
-            else:
-                # This is a positive number
-                value = value / 100.0
-            
-            processed_values.append(value)
-        
-        decompressed_events = []
-        for value in processed_values:
-            if value < 0:
-                # Negative number represents rest, need to convert to "-milliseconds" format
-                int_val = int(round(abs(value)))
-                decompressed_events.append(f"-{int_val}")
-            else:
-                # Positive number represents note, format is "key.milliseconds"
-                key_part = int(value)
-                ms_part = int(round((value - key_part) * 1000))
-                decompressed_events.append(f"{key_part}.{ms_part}")
-        
-        return decompressed_events
-    
-    def generate_workshop_code(self, compressed_strings):
-        """Generate workshop code"""
-        if not self.current_file:
-            return
-        
-        filename = os.path.basename(self.current_file)
-        filename_without_ext = os.path.splitext(filename)[0]
-
-        string_array = "Array(\n"
-        
-        for i in range(0, len(compressed_strings), 5):
-            line = compressed_strings[i:i+5]
-            custom_strings = [f'Custom String("{s}")' for s in line]
-            prefix = "\t\t" if i == 0 else ",\n\t\t"
-            string_array += prefix + ", ".join(custom_strings)
-        string_array += ");"
-        
-        try:
-            subroutine_id = int(self.entry_subroutine.get())
-        except:
-            subroutine_id = 50
-        
-        code = f"""Rule("{filename_without_ext}")
-{{
-    Event
-    {{
-        Subroutine;
-        S{subroutine_id};
-    }}
-    Action
-    {{
-        Event Player.Tempo = {self.bpm};
-        Event Player.Sheet = {string_array}
-    }}
-}}"""
-        
-        self.workshop_code.delete(1.0, tk.END)
-        self.workshop_code.insert(tk.END, code)
+    def show_workshop_code(self, code):
+        """Display workshop code"""
+        self.workshop_code.set_text(code)
     
     def save_file(self):
         """Save result"""
@@ -1139,14 +1150,14 @@ class MidiConverterApp(ctk.CTk):
         if save_path:
             try:
                 with open(save_path, 'w', encoding='utf-8') as f:
-                    f.write("\n".join(self.raw_data))
+                    f.write("\n".join(midi_core.format_events(self.raw_data)))
                 messagebox.showinfo("Save Success", f"File saved to:\n{save_path}")
             except Exception as e:
                 messagebox.showerror("Save Failed", f"Error saving file:\n{str(e)}")
     
     def save_workshop_code(self):
         """Save workshop code"""
-        if not hasattr(self, 'workshop_code'):
+        if not self.compressed_data or self.workshop_rule is None:
             messagebox.showerror("Error", "No workshop code to save")
             return
         
@@ -1160,9 +1171,8 @@ class MidiConverterApp(ctk.CTk):
         
         if save_path:
             try:
-                code_text = self.workshop_code.get(1.0, tk.END)
-                with open(save_path, 'w', encoding='utf-8') as f:
-                    f.write(code_text)
+                # Stream from the compressed strings rather than the displayed text
+                midi_core.save_workshop_code(save_path, self.compressed_data, *self.workshop_rule)
                 messagebox.showinfo("Save Success", f"Workshop code saved to:\n{save_path}")
             except Exception as e:
                 messagebox.showerror("Save Failed", f"Error saving file:\n{str(e)}")
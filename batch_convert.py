@@ -0,0 +1,279 @@
+"""Headless batch conversion of MIDI files to workshop code.
+
+Runs the same convert -> compress -> workshop code pipeline as the GUI over a
+directory or a list of files, spread across a process pool. Only depends on
+midi_core, so it works on machines without customtkinter or pygame.
+
+Examples:
+    python batch_convert.py songs/ -o out/
+    python batch_convert.py a.mid b.mid --shift -12 --tracks 0,2 --jobs 4
+    python batch_convert.py songs/ -o out/ --options options.json
+    python batch_convert.py huge.mid --stream
+    python batch_convert.py huge.mid --stream --max-hold 0
+    python batch_convert.py songs/ -o out/ --cache-dir ~/.cache/midi-converter
+    python batch_convert.py songs/ -o out/ --encoding compact
+    python batch_convert.py songs/ -o out/ --chords
+    python batch_convert.py songs/ -o out/ --quantize 4 --max-error-ms 15
+
+The options file maps a file name (or path) to per-file overrides:
+    {"song.mid": {"shift": 12, "tracks": [0, 1], "subroutine": 51, "encoding": "compact", "chords": true,
+                  "quantize": 4, "max_error_ms": 15}}
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import midi_cache
+import midi_core
+import midi_stream
+
+MIDI_EXTENSIONS = ('.mid', '.midi')
+
+
+def collect_midi_files(inputs, recursive=False):
+    """Expand input paths into a sorted list of MIDI files"""
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            if recursive:
+                for root, _, names in os.walk(path):
+                    files.extend(os.path.join(root, n) for n in names if n.lower().endswith(MIDI_EXTENSIONS))
+            else:
+                files.extend(os.path.join(path, n) for n in os.listdir(path) if n.lower().endswith(MIDI_EXTENSIONS))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            logging.warning(f"Skipping missing input: {path}")
+    return sorted(set(files))
+
+
+def parse_tracks(value):
+    """Parse a comma separated track list such as "0,2,3" """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (list, tuple)):
+        return [int(v) for v in value]
+    return [int(v) for v in str(value).split(',') if v.strip()]
+
+
+def load_options(path):
+    """Load the per-file options file"""
+    if not path:
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def options_for(filepath, defaults, per_file):
+    """Merge default options with the per-file overrides for one file"""
+    options = dict(defaults)
+    override = per_file.get(filepath) or per_file.get(os.path.basename(filepath)) or {}
+    if 'shift' in override:
+        options['shift'] = int(override['shift'])
+    if 'tracks' in override:
+        options['tracks'] = parse_tracks(override['tracks'])
+    if 'subroutine' in override:
+        options['subroutine'] = int(override['subroutine'])
+    if 'encoding' in override:
+        options['encoding'] = override['encoding']
+    if 'chords' in override:
+        options['chords'] = bool(override['chords'])
+    if 'quantize' in override:
+        options['quantize'] = int(override['quantize'])
+    if 'max_error_ms' in override:
+        options['max_error_ms'] = float(override['max_error_ms'])
+    return options
+
+
+def convert_one(filepath, options, output_dir, stream=False, cache_dir=None, cache_max_bytes=None):
+    """Convert a single file and write its outputs; runs inside a worker process"""
+    start = time.perf_counter()
+    cache_hit = False
+    timing = None
+    truncated = 0
+    try:
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        out_dir = output_dir or os.path.dirname(os.path.abspath(filepath))
+        raw_path = os.path.join(out_dir, f"{name}.txt")
+        workshop_path = os.path.join(out_dir, f"{name}_workshop.txt")
+
+        if stream:
+            if options['quantize']:
+                raise ValueError("Quantization is not supported by the streaming pipeline")
+            stats = midi_stream.stream_convert_file(filepath, workshop_path, raw_path,
+                                                    shift_amount=options['shift'],
+                                                    selected_tracks=options['tracks'],
+                                                    subroutine_id=options['subroutine'],
+                                                    encoding=options['encoding'],
+                                                    chords=options['chords'],
+                                                    max_hold_seconds=options['max_hold'] or None)
+            num_events = stats['num_events']
+            num_strings = stats['num_strings']
+            truncated = stats['num_truncated']
+        else:
+            cache = midi_cache.ConversionCache(cache_dir, cache_max_bytes) if cache_dir else None
+            result, cache_hit = midi_cache.cached_convert_file(filepath,
+                                                               shift_amount=options['shift'],
+                                                               selected_tracks=options['tracks'],
+                                                               subroutine_id=options['subroutine'],
+                                                               cache=cache,
+                                                               encoding=options['encoding'],
+                                                               chords=options['chords'],
+                                                               quantize=options['quantize'],
+                                                               max_error_ms=options['max_error_ms'])
+            with open(raw_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(midi_core.format_events(result['raw_data'])))
+            with open(workshop_path, 'w', encoding='utf-8') as f:
+                f.write(result['workshop_code'])
+            num_events = result['num_events']
+            num_strings = len(result['compressed_strings'])
+            if options['quantize']:
+                timing = midi_core.error_distribution(result['timing_errors_ms'])
+
+        return {
+            'file': filepath,
+            'ok': True,
+            'events': num_events,
+            'strings': num_strings,
+            'cached': cache_hit,
+            'timing_errors': timing,
+            'truncated': truncated,
+            'seconds': time.perf_counter() - start,
+        }
+    except Exception as e:
+        return {
+            'file': filepath,
+            'ok': False,
+            'error': f"{type(e).__name__}: {e}",
+            'traceback': traceback.format_exc(),
+            'seconds': time.perf_counter() - start,
+        }
+
+
+def run_batch(files, defaults, per_file=None, output_dir=None, jobs=None, stream=False,
+              cache_dir=None, cache_max_bytes=midi_cache.DEFAULT_MAX_BYTES):
+    """Convert files across a process pool, returning the per-file results"""
+    per_file = per_file or {}
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    if jobs == 1:
+        for filepath in files:
+            results.append(convert_one(filepath, options_for(filepath, defaults, per_file), output_dir, stream,
+                                       cache_dir, cache_max_bytes))
+        return results
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(convert_one, filepath, options_for(filepath, defaults, per_file), output_dir,
+                                   stream, cache_dir, cache_max_bytes)
+                   for filepath in files]
+        for future in as_completed(futures):
+            result = future.result()
+            if not result['ok']:
+                logging.error(f"Failed to convert {result['file']}: {result['error']}")
+            results.append(result)
+    return results
+
+
+def print_summary(results, elapsed):
+    """Print throughput and failure summary"""
+    ok = [r for r in results if r['ok']]
+    failed = [r for r in results if not r['ok']]
+    total_events = sum(r['events'] for r in ok)
+
+    print(f"Converted {len(ok)}/{len(results)} files in {elapsed:.2f}s")
+    if elapsed > 0:
+        print(f"Throughput: {len(results) / elapsed:.1f} files/s, {total_events / elapsed:.0f} events/s")
+    print(f"Total events: {total_events}, total strings: {sum(r['strings'] for r in ok)}")
+    if any(r.get('cached') for r in ok):
+        print(f"Cache hits: {sum(1 for r in ok if r.get('cached'))}/{len(ok)}")
+    quantized = [r['timing_errors'] for r in ok if r.get('timing_errors')]
+    if any(r.get('truncated') for r in ok):
+        print(f"Notes ended at --max-hold: {sum(r['truncated'] for r in ok)} "
+              f"in {sum(1 for r in ok if r.get('truncated'))} files")
+    if quantized:
+        print(f"Quantization error: worst max {max(t['max'] for t in quantized):.1f} ms, "
+              f"worst p99 {max(t['p99'] for t in quantized):.1f} ms")
+
+    if failed:
+        print(f"Failures ({len(failed)}):")
+        for r in failed:
+            print(f"  {r['file']}: {r['error']}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Convert MIDI files to workshop code without the GUI")
+    parser.add_argument('inputs', nargs='+', help="MIDI files or directories")
+    parser.add_argument('-o', '--output-dir', help="Output directory (default: next to each input file)")
+    parser.add_argument('-r', '--recursive', action='store_true', help="Recurse into sub directories")
+    parser.add_argument('--shift', type=int, default=0, help="Pitch shift in semitones")
+    parser.add_argument('--tracks', help="Comma separated track indices (default: all tracks)")
+    parser.add_argument('--subroutine', type=int, default=midi_core.DEFAULT_SUBROUTINE_ID,
+                        help="Workshop subroutine ID (1-99)")
+    parser.add_argument('--encoding', choices=sorted(midi_core.ENCODING_IDS), default=midi_core.ENCODING_FIXED,
+                        help="Sheet encoding (compact and lz need a player that reads Event Player.SheetFormat)")
+    parser.add_argument('--chords', action='store_true',
+                        help="Pack notes that start together into chord events")
+    parser.add_argument('--quantize', type=int, default=0, metavar='N',
+                        help="Snap note starts and ends to a 1/N beat grid (0: off)")
+    parser.add_argument('--max-error-ms', type=float, default=midi_core.QUANTIZE_MAX_ERROR_MS,
+                        help="Largest timing change quantization may make to a note")
+    parser.add_argument('--options', help="JSON file with per-file shift/tracks/subroutine/encoding/chords/"
+                                          "quantize/max_error_ms overrides")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--stream', action='store_true',
+                        help="Use the streaming pipeline (bounded memory for very large files)")
+    parser.add_argument('--max-hold', type=float, default=midi_stream.MAX_HOLD_SECONDS, metavar='SECONDS',
+                        help="With --stream, end notes that sound longer than this (0: wait for every note, "
+                             "which can hold many notes in memory)")
+    parser.add_argument('--cache-dir', help="Reuse results from this conversion cache directory")
+    parser.add_argument('--cache-max-mb', type=int, default=midi_cache.DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Conversion cache size cap in MB")
+    parser.add_argument('--summary-json', help="Write per-file results to this JSON file")
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = build_parser().parse_args(argv)
+
+    if not 1 <= args.subroutine <= 99:
+        print("Subroutine ID must be between 1-99", file=sys.stderr)
+        return 2
+
+    if args.stream and args.quantize:
+        print("--quantize cannot be combined with --stream", file=sys.stderr)
+        return 2
+
+    files = collect_midi_files(args.inputs, args.recursive)
+    if not files:
+        print("No MIDI files found", file=sys.stderr)
+        return 2
+
+    defaults = {'shift': args.shift, 'tracks': parse_tracks(args.tracks), 'subroutine': args.subroutine,
+                'encoding': args.encoding, 'chords': args.chords, 'quantize': args.quantize,
+                'max_error_ms': args.max_error_ms, 'max_hold': args.max_hold}
+    per_file = load_options(args.options)
+
+    start = time.perf_counter()
+    results = run_batch(files, defaults, per_file, args.output_dir, args.jobs, args.stream,
+                        args.cache_dir, args.cache_max_mb * 1024 * 1024)
+    elapsed = time.perf_counter() - start
+
+    print_summary(results, elapsed)
+
+    if args.summary_json:
+        with open(args.summary_json, 'w', encoding='utf-8') as f:
+            json.dump({'elapsed': elapsed, 'results': results}, f, indent=2)
+
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+"""Benchmark the conversion and playback pipeline on a synthetic MIDI corpus.
+
+Generates reproducible MIDI files (seeded) parameterized by track count,
+notes per track, polyphony and tempo-change density, then times every stage
+separately and records its peak traced memory:
+
+    load -> merge -> convert -> compress -> decompress -> verify -> workshop -> playback
+
+Playback runs midi_playback.PlaybackScheduler against a null output on a
+virtual clock, so it measures scheduling overhead rather than song length.
+Results are written as JSON and can be compared against a saved baseline.
+
+Examples:
+    python benchmark.py -o bench.json
+    python benchmark.py --preset large --repeat 5
+    python benchmark.py --tracks 16 --notes 20000 --polyphony 4 --tempo-density 2
+    python benchmark.py -o new.json --baseline bench.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import mido
+
+import midi_core
+import midi_playback
+
+PRESETS = {
+    'small': {'tracks': 2, 'notes': 1000, 'polyphony': 2, 'tempo_density': 1.0},
+    'medium': {'tracks': 8, 'notes': 10000, 'polyphony': 3, 'tempo_density': 1.0},
+    'large': {'tracks': 16, 'notes': 50000, 'polyphony': 4, 'tempo_density': 2.0},
+}
+
+STAGES = ('load', 'merge', 'convert', 'compress', 'decompress', 'verify', 'workshop', 'playback')
+
+
+def generate_midi(path, tracks, notes, polyphony=1, tempo_density=1.0, ticks_per_beat=480, seed=0):
+    """Write a synthetic MIDI file
+
+    Each track has `notes` notes played as chords of `polyphony` notes;
+    tempo_density is the number of tempo changes per 100 beats.
+    """
+    rng = random.Random(seed)
+    mid = mido.MidiFile(ticks_per_beat=ticks_per_beat)
+    end_tick = 0
+
+    for track_idx in range(tracks):
+        events = []
+        tick = 0
+        for _ in range(0, notes, polyphony):
+            tick += rng.choice((1, 1, 2, 4)) * ticks_per_beat // 4
+            for note in rng.sample(range(36, 100), polyphony):
+                duration = rng.choice((1, 2, 4, 8)) * ticks_per_beat // 4
+                events.append((tick, 1, note, rng.randint(40, 127)))
+                events.append((tick + duration, 0, note, 0))
+                end_tick = max(end_tick, tick + duration)
+        # Note offs before note ons on the same tick
+        events.sort(key=lambda e: (e[0], e[1]))
+
+        track = mido.MidiTrack()
+        track.append(mido.MetaMessage('track_name', name=f"Track {track_idx}"))
+        last = 0
+        for tick, _, note, velocity in events:
+            track.append(mido.Message('note_on', note=note, velocity=velocity,
+                                      channel=track_idx % 16, time=tick - last))
+            last = tick
+        mid.tracks.append(track)
+
+    conductor = mido.MidiTrack()
+    num_changes = max(1, int(end_tick / ticks_per_beat / 100 * tempo_density))
+    last = 0
+    for i in range(num_changes):
+        tick = end_tick * i // num_changes
+        conductor.append(mido.MetaMessage('set_tempo', tempo=rng.randint(300000, 900000), time=tick - last))
+        last = tick
+    mid.tracks.insert(0, conductor)
+
+    mid.save(path)
+
+
+class _VirtualClock:
+    """Clock and condition for PlaybackScheduler that jump to each deadline instead of sleeping"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def wait(self, timeout=None):
+        if timeout is not None:
+            self.now += timeout
+        return False
+
+    def notify_all(self):
+        pass
+
+
+def run_playback(timeline):
+    """Schedule a timeline against a null output; returns the scheduler statistics"""
+    event_times = timeline.seconds.tolist()
+    event_notes = timeline.notes.tolist()
+    event_velocities = timeline.velocities.tolist()
+    event_is_on = timeline.is_on.tolist()
+    event_tracks = timeline.tracks.tolist()
+    active_notes = midi_playback.ActiveNotes()
+
+    def dispatch(start, end):
+        batch = []
+        for i in range(start, end):
+            channel = event_tracks[i] % 16
+            if event_is_on[i]:
+                batch.append([[0x90 + channel, event_notes[i], event_velocities[i]], 0])
+                active_notes.note_on(event_tracks[i], event_notes[i])
+            else:
+                batch.append([[0x80 + channel, event_notes[i], 0], 0])
+                active_notes.note_off(event_tracks[i], event_notes[i])
+
+    clock = _VirtualClock()
+    scheduler = midi_playback.PlaybackScheduler(event_times, dispatch, is_paused=lambda: False,
+                                                is_stopped=lambda: False, on_progress=lambda position: None,
+                                                clock=clock)
+    scheduler.condition = clock
+    scheduler.run()
+    return scheduler.stats()
+
+
+def _stage_functions(path):
+    """(name, fn(state), count(state)) for every stage; each fn stores its output in state"""
+    def load(s):
+        s['song'] = midi_core.LoadedSong.load(path)
+
+    def merge(s):
+        song = s['song']
+        # A fresh song so the memoized timeline is rebuilt every run
+        fresh = midi_core.LoadedSong(song.ticks_per_beat, song.tracks, path)
+        s['timeline'] = fresh.timeline(range(len(song.tracks)))
+
+    def convert(s):
+        s['events'] = midi_core.convert_timeline(s['timeline'])
+
+    def compress(s):
+        s['strings'] = midi_core.encode_values(midi_core.events_to_values(s['events']))
+
+    def decompress(s):
+        s['decoded'] = midi_core.decode_events(s['strings'], len(s['events']))
+
+    def verify(s):
+        s['match_count'] = midi_core.compare_events(s['events'], s['decoded'])[0]
+
+    def workshop(s):
+        s['workshop_code'] = midi_core.generate_workshop_code(s['strings'], 'benchmark', bpm=s['song'].bpm)
+
+    def playback(s):
+        s['playback_stats'] = run_playback(s['timeline'])
+
+    def loaded_events(s):
+        return sum(len(track.ticks) for track in s['song'].tracks)
+
+    def note_events(s):
+        return len(s['timeline'])
+
+    def keyboard_events(s):
+        return len(s['events'])
+
+    return [
+        ('load', load, loaded_events),
+        ('merge', merge, note_events),
+        ('convert', convert, keyboard_events),
+        ('compress', compress, keyboard_events),
+        ('decompress', decompress, keyboard_events),
+        ('verify', verify, keyboard_events),
+        ('workshop', workshop, keyboard_events),
+        ('playback', playback, note_events),
+    ]
+
+
+def benchmark_file(path, repeat=3):
+    """Time every stage on one file; returns {stage: {...}} and the final pipeline state"""
+    state = {}
+    results = {}
+    for name, fn, count in _stage_functions(path):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn(state)
+            best = min(best, time.perf_counter() - start)
+
+        # A separate traced run, since tracemalloc slows the stage down
+        tracemalloc.start()
+        try:
+            fn(state)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        events = count(state)
+        results[name] = {
+            'seconds': best,
+            'events': events,
+            'events_per_sec': events / best if best > 0 else None,
+            'peak_mb': peak / (1024 * 1024),
+        }
+    return results, state
+
+
+def run_suite(cases, corpus_dir, repeat=3, seed=0):
+    """Generate (if needed) and benchmark every case; returns the results document"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    document = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'cases': {},
+    }
+
+    for case_name, params in cases.items():
+        path = os.path.join(corpus_dir, f"{case_name}_t{params['tracks']}_n{params['notes']}"
+                                        f"_p{params['polyphony']}_d{params['tempo_density']}_s{seed}.mid")
+        if not os.path.exists(path):
+            generate_midi(path, params['tracks'], params['notes'], params['polyphony'], params['tempo_density'],
+                          seed=seed)
+
+        stages, state = benchmark_file(path, repeat)
+        document['cases'][case_name] = {
+            'params': params,
+            'file_bytes': os.path.getsize(path),
+            'note_events': len(state['timeline']),
+            'keyboard_events': len(state['events']),
+            'total_seconds': sum(s['seconds'] for s in stages.values()),
+            'stages': stages,
+            'playback': state['playback_stats'],
+        }
+    return document
+
+
+def compare_to_baseline(document, baseline, threshold=0.2):
+    """Return [(case, stage, baseline_seconds, seconds)] for stages slower than baseline by > threshold"""
+    regressions = []
+    for case_name, case in document['cases'].items():
+        base_case = baseline.get('cases', {}).get(case_name)
+        if not base_case or base_case.get('params') != case['params']:
+            continue
+        for stage, result in case['stages'].items():
+            base = base_case['stages'].get(stage)
+            if base and result['seconds'] > base['seconds'] * (1 + threshold):
+                regressions.append((case_name, stage, base['seconds'], result['seconds']))
+    return regressions
+
+
+def print_report(document, baseline=None):
+    for case_name, case in document['cases'].items():
+        base_case = (baseline or {}).get('cases', {}).get(case_name) or {}
+        print(f"\n{case_name}: {case['note_events']} note events, {case['keyboard_events']} keyboard events, "
+              f"{case['file_bytes'] / 1024:.0f} KB")
+        print(f"  {'stage':<12}{'ms':>10}{'events/s':>14}{'peak MB':>10}{'vs base':>10}")
+        for stage in STAGES:
+            result = case['stages'][stage]
+            base = base_case.get('stages', {}).get(stage)
+            change = f"{(result['seconds'] / base['seconds'] - 1) * 100:+.0f}%" if base and base['seconds'] else ""
+            rate = f"{result['events_per_sec']:.0f}" if result['events_per_sec'] else "-"
+            print(f"  {stage:<12}{result['seconds'] * 1000:>10.2f}{rate:>14}{result['peak_mb']:>10.2f}{change:>10}")
+        playback = case['playback']
+        print(f"  playback: {playback['batches']} batches, {playback['wakeups']} wakeups")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the MIDI conversion pipeline on synthetic files")
+    parser.add_argument('--preset', choices=sorted(PRESETS) + ['all'], default='all',
+                        help="Corpus size to run (default: all presets)")
+    parser.add_argument('--tracks', type=int, help="Custom case: number of tracks")
+    parser.add_argument('--notes', type=int, help="Custom case: notes per track")
+    parser.add_argument('--polyphony', type=int, default=1, help="Custom case: notes per chord")
+    parser.add_argument('--tempo-density', type=float, default=1.0, help="Custom case: tempo changes per 100 beats")
+    parser.add_argument('--seed', type=int, default=0, help="Corpus random seed")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per stage; the fastest is reported")
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'midi-converter-bench'),
+                        help="Where generated MIDI files are kept")
+    parser.add_argument('-o', '--output', help="Write results to this JSON file")
+    parser.add_argument('--baseline', help="Compare against a previous results JSON file")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Slowdown versus baseline reported as a regression (0.2 = 20%%)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.tracks or args.notes:
+        if not (args.tracks and args.notes):
+            print("--tracks and --notes must be given together", file=sys.stderr)
+            return 2
+        cases = {'custom': {'tracks': args.tracks, 'notes': args.notes,
+                            'polyphony': args.polyphony, 'tempo_density': args.tempo_density}}
+    elif args.preset == 'all':
+        cases = PRESETS
+    else:
+        cases = {args.preset: PRESETS[args.preset]}
+
+    document = run_suite(cases, args.corpus_dir, args.repeat, args.seed)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print_report(document, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare_to_baseline(document, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions (> {args.threshold * 100:.0f}% slower than baseline):")
+            for case_name, stage, base_seconds, seconds in regressions:
+                print(f"  {case_name}/{stage}: {base_seconds * 1000:.2f} ms -> {seconds * 1000:.2f} ms")
+            return 1
+        print("\nNo regressions against baseline")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import argparse
 import os
 import sys
 import PyInstaller.__main__
@@ -29,7 +30,24 @@ def get_ctk_tcl_path():
         print(f"获取CustomTkinter路径时出错: {e}")
         sys.exit(1)
 
+def dir_size(path):
+    """计算目录总大小（字节）"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="打包MIDI-Converter")
+    parser.add_argument('--mode', choices=['onefile', 'onedir'], default='onefile',
+                        help="onefile: 单个可执行文件（每次启动需解压，启动较慢）; "
+                             "onedir: 文件夹形式（无需解压，启动快）")
+    return parser.parse_args()
+
 def main():
+    options = parse_args()
+    
     # 获取当前目录路径
     current_dir = os.path.dirname(os.path.abspath(__file__))
     
@@ -53,7 +71,7 @@ def main():
     args = [
         script_path,           # 主脚本文件
         '--windowed',           # 不显示控制台窗口
-        '--onefile',            # 打包为单个可执行文件
+        f'--{options.mode}',    # onefile: 单个可执行文件; onedir: 文件夹形式，启动更快
         '--noconsole',          # 无控制台窗口
         '--name=MIDI-Converter', # 可执行文件名称
         f'--add-data={ctk_tcl_path}{os.pathsep}customtkinter/tcl',  # 添加tcl资源
@@ -106,16 +124,20 @@ def main():
     
     # 确定可执行文件路径
     exe_name = "MIDI-Converter.exe" if sys.platform == 'win32' else "MIDI-Converter"
-    exe_path = os.path.join(dist_dir, exe_name)
+    exe_dir = os.path.join(dist_dir, "MIDI-Converter") if options.mode == 'onedir' else dist_dir
+    exe_path = os.path.join(exe_dir, exe_name)
     
     if os.path.exists(exe_path):
         print(f"\n成功生成可执行文件: {exe_path}")
-        print(f"文件大小: {os.path.getsize(exe_path) / (1024 * 1024):.2f} MB")
+        if options.mode == 'onedir':
+            print(f"文件夹大小: {dir_size(exe_dir) / (1024 * 1024):.2f} MB（发布时请分发整个文件夹）")
+        else:
+            print(f"文件大小: {os.path.getsize(exe_path) / (1024 * 1024):.2f} MB")
         
         # 尝试运行可执行文件（仅Windows）
         if sys.platform == 'win32':
             print("\n尝试运行可执行文件进行测试...")
-            os.chdir(dist_dir)
+            os.chdir(exe_dir)
             os.startfile(exe_name)
     else:
         print("\n错误: 未能生成可执行文件")
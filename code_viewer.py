@@ -0,0 +1,109 @@
+"""Paged, incrementally filled text viewer for large workshop code.
+
+A Tk Text widget freezes for seconds when megabytes are inserted at once and
+stays slow to scroll afterwards. CodeViewer keeps the full text in memory
+(get_text() returns it for saving and copying) and shows it one page of
+lines at a time. Each page is inserted in small chunks from after()
+callbacks, so the window keeps handling events while it fills. The widget
+is read-only: saving and copying use the full text, so edits would be lost.
+"""
+import tkinter as tk
+from tkinter import scrolledtext
+
+import customtkinter as ctk
+
+PAGE_LINES = 400
+INSERT_CHUNK_CHARS = 16384
+
+
+def page_offsets(text, lines_per_page=PAGE_LINES):
+    """Start offsets of each page of lines_per_page lines in text"""
+    offsets = [0]
+    pos = 0
+    count = 0
+    while True:
+        pos = text.find('\n', pos) + 1
+        if pos == 0 or pos >= len(text):
+            break
+        count += 1
+        if count % lines_per_page == 0:
+            offsets.append(pos)
+    return offsets
+
+
+class CodeViewer(ctk.CTkFrame):
+    """Read-only text view that pages and incrementally inserts large text"""
+
+    def __init__(self, master, **kwargs):
+        super().__init__(master, **kwargs)
+        self.text = ""
+        self.offsets = [0]
+        self.page = 0
+        self.fill_job = None
+
+        # Toolbar below the text: Copy All always, the pager only when the text has more than one page.
+        # Packed first so a short window shrinks the text, not the toolbar.
+        self.toolbar = ctk.CTkFrame(self, fg_color="transparent")
+        self.toolbar.pack(side="bottom", fill="x")
+        self.text_widget = scrolledtext.ScrolledText(self, height=15, bg='#2b2b2b', fg='white', state="disabled")
+        self.text_widget.pack(fill="both", expand=True)
+        self.btn_copy = ctk.CTkButton(self.toolbar, text="Copy All", width=80, command=self.copy_all)
+        self.btn_copy.pack(side="right", padx=5, pady=2)
+        self.pager = ctk.CTkFrame(self.toolbar, fg_color="transparent")
+        self.btn_prev = ctk.CTkButton(self.pager, text="◀", width=30, command=lambda: self.show_page(self.page - 1))
+        self.btn_prev.pack(side="left", padx=5, pady=2)
+        self.lbl_page = ctk.CTkLabel(self.pager, text="")
+        self.lbl_page.pack(side="left", padx=5)
+        self.btn_next = ctk.CTkButton(self.pager, text="▶", width=30, command=lambda: self.show_page(self.page + 1))
+        self.btn_next.pack(side="left", padx=5, pady=2)
+
+    @property
+    def num_pages(self):
+        return len(self.offsets)
+
+    def set_text(self, text):
+        """Replace the viewer contents and show the first page"""
+        self.text = text
+        self.offsets = page_offsets(text)
+        if self.num_pages > 1:
+            self.pager.pack(side="left")
+        else:
+            self.pager.pack_forget()
+        self.show_page(0)
+
+    def get_text(self):
+        """The full text, including pages that are not displayed"""
+        return self.text
+
+    def show_page(self, page):
+        """Display page (0-based), filling the widget incrementally"""
+        page = max(0, min(page, self.num_pages - 1))
+        self.page = page
+        start = self.offsets[page]
+        end = self.offsets[page + 1] if page + 1 < self.num_pages else len(self.text)
+
+        self.lbl_page.configure(text=f"Page {page + 1} / {self.num_pages}")
+        self.btn_prev.configure(state="normal" if page > 0 else "disabled")
+        self.btn_next.configure(state="normal" if page + 1 < self.num_pages else "disabled")
+
+        if self.fill_job is not None:
+            self.after_cancel(self.fill_job)
+            self.fill_job = None
+        self.text_widget.configure(state="normal")
+        self.text_widget.delete(1.0, tk.END)
+        self.text_widget.configure(state="disabled")
+        self._fill(start, end)
+
+    def _fill(self, pos, end):
+        self.fill_job = None
+        chunk_end = min(pos + INSERT_CHUNK_CHARS, end)
+        self.text_widget.configure(state="normal")
+        self.text_widget.insert(tk.END, self.text[pos:chunk_end])
+        self.text_widget.configure(state="disabled")
+        if chunk_end < end:
+            self.fill_job = self.after(1, self._fill, chunk_end, end)
+
+    def copy_all(self):
+        """Copy the full text to the clipboard"""
+        self.clipboard_clear()
+        self.clipboard_append(self.text)
@@ -0,0 +1,204 @@
+"""Content-addressed on-disk cache of conversion results.
+
+Entries are keyed by the SHA-256 of the MIDI file contents plus every setting
+that affects the output (shift, track selection, subroutine ID, rule name,
+encoding, chords, quantization and midi_core.ENCODER_VERSION), so changing any
+setting never returns stale data. Moving a file to another directory keeps its
+entries; renaming it does not, because the rule name is the file name and is
+written into the workshop code. Each entry is a single
+.npz file; the least recently used entries are evicted once the cache grows
+past its size cap.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+import midi_core
+from midi_metrics import span
+
+DEFAULT_CACHE_DIR = os.environ.get('MIDI_CONVERTER_CACHE',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'midi-converter'))
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def file_digest(filepath):
+    """SHA-256 of a file's contents"""
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def header_track_count(filepath):
+    """Number of tracks declared in a Standard MIDI File header, or None if it has none"""
+    with open(filepath, 'rb') as f:
+        header = f.read(12)
+    return int.from_bytes(header[10:12], 'big') if len(header) == 12 and header[:4] == b'MThd' else None
+
+
+def normalize_tracks(selected_tracks, num_tracks):
+    """The sorted track selection as convert_file uses it, or None for all tracks"""
+    if not selected_tracks:
+        return None
+    if num_tracks is None:
+        return sorted(set(selected_tracks))
+    tracks = sorted(set(i for i in selected_tracks if 0 <= i < num_tracks))
+    return None if len(tracks) == num_tracks else tracks
+
+
+class ConversionCache:
+    """LRU-evicted directory of conversion results"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def make_key(self, digest, shift_amount, selected_tracks, subroutine_id, rule_name,
+                 encoding=midi_core.ENCODING_FIXED, chords=False, quantize=0,
+                 max_error_ms=midi_core.QUANTIZE_MAX_ERROR_MS, num_tracks=None):
+        """Build the cache key for a file digest and conversion settings
+
+        With the file's num_tracks, selecting every track gives the same key as
+        selected_tracks=None.
+        """
+        settings = json.dumps({
+            'digest': digest,
+            'shift': shift_amount,
+            'tracks': normalize_tracks(selected_tracks, num_tracks),
+            'subroutine': subroutine_id,
+            'rule': rule_name,
+            'encoding': encoding,
+            'chords': chords,
+            'quantize': quantize,
+            'max_error_ms': float(max_error_ms) if quantize else None,
+            'encoder': midi_core.ENCODER_VERSION,
+        }, sort_keys=True)
+        return hashlib.sha256(settings.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key):
+        """Return the cached result for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                result = {
+                    'raw_data': data['raw_data'],
+                    'compressed_strings': data['compressed_strings'].tolist(),
+                    'workshop_code': str(data['workshop_code']),
+                    'bpm': int(data['bpm']),
+                    # Entries written before quantization support have no timing errors
+                    'timing_errors_ms': (data['timing_errors_ms'] if 'timing_errors_ms' in data.files
+                                         else np.zeros(0)),
+                }
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Dropping unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        result['num_events'] = len(result['raw_data'])
+        result['num_notes'] = midi_core.count_events(result['raw_data'])[0]
+        return result
+
+    def put(self, key, result):
+        """Store a conversion result and evict old entries if over the size cap"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f,
+                         raw_data=result['raw_data'],
+                         compressed_strings=np.array(result['compressed_strings'], dtype=str),
+                         workshop_code=np.array(result['workshop_code']),
+                         bpm=np.array(result['bpm']),
+                         timing_errors_ms=result['timing_errors_ms'])
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        """Remove every entry"""
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                self._remove(os.path.join(self.directory, name))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def cached_convert_file(filepath, shift_amount=0, selected_tracks=None,
+                        subroutine_id=midi_core.DEFAULT_SUBROUTINE_ID, cache=None, song=None,
+                        encoding=midi_core.ENCODING_FIXED, chords=False, quantize=0,
+                        max_error_ms=midi_core.QUANTIZE_MAX_ERROR_MS):
+    """midi_core.convert_file with a cache lookup in front of it
+
+    Returns (result, hit). Without a cache this is a plain conversion; song is
+    passed through to convert_file on a miss.
+    """
+    if cache is None:
+        return midi_core.convert_file(filepath, shift_amount, selected_tracks, subroutine_id, song,
+                                      encoding=encoding, chords=chords, quantize=quantize,
+                                      max_error_ms=max_error_ms), False
+
+    rule_name = os.path.splitext(os.path.basename(filepath))[0]
+    with span('cache_lookup'):
+        num_tracks = len(song.tracks) if song is not None else header_track_count(filepath)
+        key = cache.make_key(file_digest(filepath), shift_amount, selected_tracks, subroutine_id, rule_name,
+                             encoding, chords, quantize, max_error_ms, num_tracks)
+        result = cache.get(key)
+    if result is not None:
+        result['encoding'] = encoding
+        result['chords'] = chords
+        return result, True
+
+    result = midi_core.convert_file(filepath, shift_amount, selected_tracks, subroutine_id, song,
+                                    encoding=encoding, chords=chords, quantize=quantize,
+                                    max_error_ms=max_error_ms)
+    try:
+        with span('cache_store'):
+            cache.put(key, result)
+    except OSError as e:
+        logging.warning(f"Failed to write conversion cache: {e}")
+    return result, False
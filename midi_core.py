@@ -0,0 +1,1053 @@
+import io
+import os
+import logging
+
+import numpy as np
+
+from midi_metrics import span
+
+# Workshop character set (128 characters)
+WORKSHOP_CHARSET = "0!@#$%^&*+ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyzΑΒΓΔΕΖΗΘΙΚΛΜαβγδεζηθικλμΝΞΟΠΡΣΤΥΦΧΨΩνξοπρστυφχψωÀÁÂÃÄÅÆÇÈÉÊËàáâãäå"
+
+DEFAULT_TEMPO = 500000
+DEFAULT_BPM = 120
+DEFAULT_SUBROUTINE_ID = 50
+
+# Buffer size for streamed file output
+WRITE_BUFFER_BYTES = 1024 * 1024
+
+# Bytes parsed between load progress reports (and so cancellation checks)
+LOAD_PROGRESS_BYTES = 1024 * 1024
+
+# Bump whenever the conversion or encoding output changes so cached results are not reused
+ENCODER_VERSION = 4
+
+# Every value is written as three base-128 digits; a Custom String holds at most
+# 128 characters, so 42 values (126 characters) are packed into each chunk
+CHARS_PER_VALUE = 3
+MAX_STRING_CHARS = 128
+STRING_CHUNK_CHARS = MAX_STRING_CHARS - MAX_STRING_CHARS % CHARS_PER_VALUE
+SCALE_OFFSET = 128 ** CHARS_PER_VALUE  # 2^21, rests are stored as value + 2^21
+
+# Digit -> codepoint lookup for the encoder and codepoint -> digit lookup for the
+# decoder; codepoints outside the charset decode as 0 through the last entry
+CHARSET_CODES = np.array([ord(c) for c in WORKSHOP_CHARSET], dtype='<u4')
+CHARSET_LOOKUP = np.zeros(CHARSET_CODES.max() + 2, dtype=np.int64)
+CHARSET_LOOKUP[CHARSET_CODES] = np.arange(len(WORKSHOP_CHARSET))
+
+# Typed event representation: a note has a key and duration, a rest only a gap.
+# A chord event adds notes to the note before it: bit i of its key is set when
+# key (previous key + 1 + i) starts at the same time with the same duration.
+EVENT_NOTE = 0
+EVENT_REST = 1
+EVENT_CHORD = 2
+EVENT_DTYPE = np.dtype([
+    ('kind', np.uint8),
+    ('key', np.int16),
+    ('duration_ms', np.int64),
+    ('gap_ms', np.int64),
+])
+DECIMAL_THRESHOLDS = 10 ** np.arange(1, 18, dtype=np.int64)
+
+# Default timing error budget when snapping to a beat grid
+QUANTIZE_MAX_ERROR_MS = 20
+
+# Chord events are stored as CHORD_BASE + interval mask, far above any note
+# value (key <= 65), so a player can tell them apart without a format flag
+CHORD_SPAN = 15
+CHORD_BASE = 1 << 19
+
+# Sheet encodings. Non-fixed encodings write their id to the workshop rule as
+# Event Player.SheetFormat so the player can pick the matching decoder.
+ENCODING_FIXED = 'fixed'
+ENCODING_COMPACT = 'compact'
+ENCODING_LZ = 'lz'
+ENCODING_IDS = {ENCODING_FIXED: 0, ENCODING_COMPACT: 1, ENCODING_LZ: 2}
+
+# Compact encoding: most values take two digits and the first digit tells the
+# kind apart; everything else is an escape digit followed by the fixed code.
+#   note value v < 8192:              [v >> 7, v & 127]
+#   rest of g ms (value exact, g < 8064): [64 + (g >> 7), g & 127]
+#   anything else:                    [127, d0, d1, d2]
+COMPACT_REST_FIRST = 64
+COMPACT_NOTE_LIMIT = COMPACT_REST_FIRST * 128
+COMPACT_ESCAPE = 127
+COMPACT_REST_LIMIT = (COMPACT_ESCAPE - COMPACT_REST_FIRST) * 128
+
+# LZ encoding: compact codes plus back-references that repeat an earlier run
+#   [126, distance (3 digits), length (2 digits)]
+# Rests use first digits 64-125 only, so they are limited to 7935 ms.
+LZ_BACKREF = 126
+LZ_TOKEN_CHARS = 6
+LZ_REST_LIMIT = (LZ_BACKREF - COMPACT_REST_FIRST) * 128
+LZ_MIN_MATCH = 4  # a reference (6 characters) must beat the literals it replaces
+LZ_MAX_MATCH = 128 ** 2 - 1
+LZ_WINDOW = 65536  # how far back (in values) a reference may point
+LZ_CHAIN_DEPTH = 16  # earlier occurrences tried per position
+
+
+class TempoMap:
+    """Tick -> second mapping that follows every set_tempo change in a file
+
+    The tempo changes are turned into segments once; whole arrays of absolute
+    ticks are then converted with a single searchsorted over the segment starts.
+    """
+
+    def __init__(self, ticks_per_beat, tempo_changes=()):
+        self.ticks_per_beat = ticks_per_beat
+
+        # Later changes on the same tick win, tick 0 replaces the default tempo
+        tempo_at = {0: DEFAULT_TEMPO}
+        for tick, tempo in sorted(tempo_changes, key=lambda x: x[0]):
+            tempo_at[tick] = tempo
+
+        ticks = sorted(tempo_at)
+        self.seg_ticks = np.array(ticks, dtype=np.int64)
+        self.seg_tempos = np.array([tempo_at[t] for t in ticks], dtype=np.int64)
+        # Same expression as mido.tick2second so single-tempo files give identical results
+        self.seg_scale = self.seg_tempos * 1e-6 / ticks_per_beat
+
+        seg_lengths = np.diff(self.seg_ticks) * self.seg_scale[:-1]
+        self.seg_seconds = np.concatenate(([0.0], np.cumsum(seg_lengths)))
+
+    @classmethod
+    def from_midi(cls, mid):
+        """Build the tempo map from the set_tempo events of all tracks"""
+        tempo_changes = []
+        for track in mid.tracks:
+            current_tick = 0
+            for msg in track:
+                current_tick += msg.time
+                if msg.type == 'set_tempo':
+                    tempo_changes.append((current_tick, msg.tempo))
+        return cls(mid.ticks_per_beat, tempo_changes)
+
+    def ticks_to_seconds(self, ticks):
+        """Convert an array of absolute ticks to seconds"""
+        ticks = np.asarray(ticks, dtype=np.int64)
+        idx = np.searchsorted(self.seg_ticks, ticks, side='right') - 1
+        return self.seg_seconds[idx] + (ticks - self.seg_ticks[idx]) * self.seg_scale[idx]
+
+    def tick_to_second(self, tick):
+        """Convert a single absolute tick to seconds"""
+        return float(self.ticks_to_seconds(tick))
+
+    def seconds_to_ticks(self, seconds):
+        """Convert an array of seconds back to (fractional) absolute ticks"""
+        seconds = np.asarray(seconds, dtype=np.float64)
+        idx = np.searchsorted(self.seg_seconds, seconds, side='right') - 1
+        idx = np.clip(idx, 0, None)
+        return self.seg_ticks[idx] + (seconds - self.seg_seconds[idx]) / self.seg_scale[idx]
+
+
+class TimingGrid:
+    """A 1/subdivision beat grid of a tempo map that times are snapped to
+
+    A time is only moved to its nearest grid line when that changes it by at
+    most max_error_ms, so the error budget holds for every note.
+    """
+
+    def __init__(self, tempo_map, subdivision=4, max_error_ms=QUANTIZE_MAX_ERROR_MS):
+        self.tempo_map = tempo_map
+        self.subdivision = subdivision
+        self.max_error_ms = max_error_ms
+        self.step_ticks = tempo_map.ticks_per_beat / subdivision
+
+    def snap(self, seconds):
+        """Return (snapped seconds, signed error in ms) for an array of times"""
+        seconds = np.asarray(seconds, dtype=np.float64)
+        ticks = self.tempo_map.seconds_to_ticks(seconds)
+        grid_ticks = np.round(np.round(ticks / self.step_ticks) * self.step_ticks).astype(np.int64)
+        snapped = self.tempo_map.ticks_to_seconds(grid_ticks)
+        errors = (snapped - seconds) * 1000
+        within = np.abs(errors) <= self.max_error_ms
+        return np.where(within, snapped, seconds), np.where(within, errors, 0.0)
+
+    def snap_notes(self, starts, ends):
+        """Snap note starts and ends; returns (starts, ends, errors in ms of both)
+
+        A note that snapping would make empty keeps its original times.
+        """
+        snapped_starts, start_errors = self.snap(starts)
+        snapped_ends, end_errors = self.snap(ends)
+        collapsed = (snapped_ends <= snapped_starts) & (ends > starts)
+        snapped_starts[collapsed] = starts[collapsed]
+        snapped_ends[collapsed] = ends[collapsed]
+        start_errors[collapsed] = 0.0
+        end_errors[collapsed] = 0.0
+        return snapped_starts, snapped_ends, np.concatenate((start_errors, end_errors))
+
+
+class TrackColumns:
+    """Note events of one track as parallel NumPy columns"""
+
+    def __init__(self, name, ticks, notes, velocities, is_on, end_tick, tempo_changes=()):
+        self.name = name
+        self.ticks = ticks
+        self.notes = notes
+        self.velocities = velocities
+        # True for note_on with velocity > 0, False for note_off / note_on with velocity 0
+        self.is_on = is_on
+        self.end_tick = end_tick
+        self.tempo_changes = list(tempo_changes)
+
+    @classmethod
+    def from_track(cls, track):
+        """Extract the note and tempo events of a mido track"""
+        ticks = []
+        notes = []
+        velocities = []
+        is_on = []
+        tempo_changes = []
+
+        current_tick = 0
+        for msg in track:
+            current_tick += msg.time
+            if msg.type == 'note_on' or msg.type == 'note_off':
+                ticks.append(current_tick)
+                notes.append(msg.note)
+                velocities.append(msg.velocity)
+                is_on.append(msg.type == 'note_on' and msg.velocity > 0)
+            elif msg.type == 'set_tempo':
+                tempo_changes.append((current_tick, msg.tempo))
+
+        return cls(track.name,
+                   np.array(ticks, dtype=np.int64),
+                   np.array(notes, dtype=np.uint8),
+                   np.array(velocities, dtype=np.uint8),
+                   np.array(is_on, dtype=bool),
+                   current_tick,
+                   tempo_changes)
+
+
+class Timeline:
+    """Note events of several tracks merged in tick order, with their times in seconds"""
+
+    def __init__(self, ticks, seconds, notes, velocities, is_on, tracks):
+        self.ticks = ticks
+        self.seconds = seconds
+        self.notes = notes
+        self.velocities = velocities
+        self.is_on = is_on
+        self.tracks = tracks
+
+    def __len__(self):
+        return len(self.ticks)
+
+
+class _ProgressFile(io.BytesIO):
+    """In-memory file that reports read progress, for parsers that read it in small pieces"""
+
+    def __init__(self, data, progress):
+        super().__init__(data)
+        self.progress = progress
+        self.size = len(data)
+        self.num_tracks = int.from_bytes(data[10:12], 'big') if data[:4] == b'MThd' else 0
+        self.next_report = LOAD_PROGRESS_BYTES
+
+    def read(self, size=-1):
+        data = super().read(size)
+        position = self.tell()
+        if position >= self.next_report:
+            self.next_report = position + LOAD_PROGRESS_BYTES
+            self.progress(position, self.size, 0, self.num_tracks)
+        return data
+
+
+class LoadedSong:
+    """A parsed MIDI file: per-track note columns, tempo map and memoized merged timelines
+
+    Parse once with LoadedSong.load and share the object between playback,
+    seeking and conversion instead of re-reading the file.
+    """
+
+    def __init__(self, ticks_per_beat, tracks, path=None, mid=None):
+        self.ticks_per_beat = ticks_per_beat
+        self.tracks = tracks
+        self.path = path
+        self.mid = mid
+        self.tempo_map = TempoMap(ticks_per_beat,
+                                  [change for track in tracks for change in track.tempo_changes])
+        self._timelines = {}
+
+    @classmethod
+    def from_midi(cls, mid, path=None):
+        """Build a song from an already parsed mido.MidiFile"""
+        return cls(mid.ticks_per_beat, [TrackColumns.from_track(track) for track in mid.tracks], path, mid)
+
+    @classmethod
+    def load(cls, path, fast=True, progress=None):
+        """Parse a MIDI file
+
+        With fast=True the memory-mapped smf_reader extracts only note and tempo
+        events; files it cannot parse fall back to mido. progress is called as
+        described in smf_reader.read_smf; the mido fallback reports bytes read
+        but no finished tracks.
+        """
+        with span('load'):
+            if fast:
+                import smf_reader
+                try:
+                    return smf_reader.load_song(path, progress)
+                except smf_reader.SMFError as e:
+                    logging.warning(f"Fast MIDI reader failed ({e}), falling back to mido")
+            import mido
+            if progress is None:
+                return cls.from_midi(mido.MidiFile(path), path)
+            with open(path, 'rb') as f:
+                infile = _ProgressFile(f.read(), progress)
+            return cls.from_midi(mido.MidiFile(file=infile), path)
+
+    @property
+    def track_names(self):
+        return [track.name for track in self.tracks]
+
+    @property
+    def bpm(self):
+        """BPM of the first tempo event, following get_bpm_from_midi"""
+        return bpm_from_tempo_changes(track.tempo_changes for track in self.tracks)
+
+    @property
+    def duration(self):
+        """Total duration in seconds; implausible lengths over a day are capped at an hour"""
+        end_tick = max((track.end_tick for track in self.tracks), default=0)
+        total_time = self.tempo_map.tick_to_second(end_tick)
+        return 3600 if total_time > 86400 else total_time
+
+    def timeline(self, selected_tracks):
+        """Merged note timeline of the selected tracks
+
+        The all-tracks timeline and the most recent other selection are
+        memoized; each holds a copy of the selected events.
+        """
+        key = tuple(sorted(set(i for i in selected_tracks if 0 <= i < len(self.tracks))))
+        timeline = self._timelines.get(key)
+        if timeline is None:
+            with span('merge'):
+                timeline = self._build_timeline(key)
+            all_tracks = tuple(range(len(self.tracks)))
+            self._timelines = {k: v for k, v in self._timelines.items() if k == all_tracks}
+            self._timelines[key] = timeline
+        return timeline
+
+    def _build_timeline(self, track_indices):
+        selected = [self.tracks[i] for i in track_indices]
+        if not selected:
+            empty = np.zeros(0, dtype=np.int64)
+            return Timeline(empty, np.zeros(0), empty.astype(np.uint8), empty.astype(np.uint8),
+                            empty.astype(bool), empty)
+
+        ticks = np.concatenate([t.ticks for t in selected])
+        # Each track is already in tick order, so the stable sort (a run-merging
+        # timsort for int64) merges k sorted runs. It keeps track order, then
+        # file order, for events on the same tick.
+        order = np.argsort(ticks, kind='stable')
+        ticks = ticks[order]
+        tracks = np.concatenate([np.full(len(t.ticks), i, dtype=np.int64)
+                                 for i, t in zip(track_indices, selected)])[order]
+
+        return Timeline(ticks,
+                        self.tempo_map.ticks_to_seconds(ticks),
+                        np.concatenate([t.notes for t in selected])[order],
+                        np.concatenate([t.velocities for t in selected])[order],
+                        np.concatenate([t.is_on for t in selected])[order],
+                        tracks)
+
+
+def bpm_from_tempo_changes(track_tempo_changes):
+    """BPM of the first tempo event, given the (tick, tempo) changes of each track in file order"""
+    tempo = DEFAULT_TEMPO
+    for tempo_changes in track_tempo_changes:
+        if tempo_changes:
+            tempo = tempo_changes[0][1]
+        if tempo != DEFAULT_TEMPO:
+            break
+
+    bpm = round(60000000 / tempo)
+    return bpm if bpm > 0 else DEFAULT_BPM
+
+
+def get_bpm_from_midi(mid):
+    """Get BPM value from MIDI file"""
+    tempo = DEFAULT_TEMPO
+    for track in mid.tracks:
+        for msg in track:
+            if msg.type == 'set_tempo':
+                tempo = msg.tempo
+                break
+        if tempo != DEFAULT_TEMPO:
+            break
+
+    bpm = round(60000000 / tempo)
+    return bpm if bpm > 0 else DEFAULT_BPM
+
+
+def convert_timeline(timeline, shift_amount=0, grid=None):
+    """Pair the notes of a merged Timeline and lay them out as keyboard events
+
+    With a TimingGrid the note starts and ends are snapped to it first.
+    """
+    starts, ends, notes = pair_notes(timeline, shift_amount)
+    if grid is not None:
+        starts, ends, _ = grid.snap_notes(starts, ends)
+    return build_events(starts, ends, notes)
+
+
+def link_events(keys, is_on):
+    """Match every note on with the event that ends it: the next event of its key
+
+    keys holds each event's pairing key (below 256) in timeline order. Returns
+    (on_events, finish_events, sounding) for the note ons in timeline order:
+    their indices, the index of the event that ends each note (its note off or
+    a note on retriggering the key) and a mask of the notes still sounding at
+    the end. For those, finish_events holds the first note on of their key's
+    final run of retriggers instead.
+    """
+    num_events = keys.size
+    on_events = np.flatnonzero(is_on)
+    if num_events == 0:
+        return on_events, on_events.copy(), np.zeros(0, dtype=bool)
+
+    # Link each event to the previous and next event of its key; a radix sort
+    # on the 8-bit keys groups them while keeping timeline order
+    by_key = np.argsort(keys.astype(np.uint8), kind='stable')
+    same_key = keys[by_key[1:]] == keys[by_key[:-1]]
+    earlier = by_key[:-1][same_key]
+    later = by_key[1:][same_key]
+    next_event = np.full(num_events, -1, dtype=np.int64)
+    next_event[earlier] = later
+    previous_event = np.full(num_events, -1, dtype=np.int64)
+    previous_event[later] = earlier
+
+    finish_events = next_event[on_events]
+    sounding = finish_events < 0
+    for i in np.flatnonzero(sounding).tolist():
+        first = on_events[i]
+        while previous_event[first] >= 0 and is_on[previous_event[first]]:
+            first = previous_event[first]
+        finish_events[i] = first
+    return on_events, finish_events, sounding
+
+
+def note_order_keys(seconds, on_events, finish_events, sounding):
+    """Integer keys that sort notes by start time, ties in the order the notes finished
+
+    Notes left sounding finish after every paired note, each ranked by the
+    first note on of its key's final run of retriggers. seconds are the event
+    times of the timeline the indices refer to.
+    """
+    num_events = seconds.size
+    start_group = np.zeros(num_events, dtype=np.int64)
+    np.cumsum(seconds[1:] != seconds[:-1], out=start_group[1:])
+    finish_order = np.where(sounding, num_events + finish_events, finish_events)
+    return start_group[on_events] * (2 * num_events) + finish_order
+
+
+def note_times(seconds, on_events, finish_events, sounding):
+    """(starts, ends) of linked notes; notes still sounding last until the final event"""
+    if seconds.size == 0:
+        return np.zeros(0), np.zeros(0)
+    return seconds[on_events], np.where(sounding, seconds.max(), seconds[finish_events])
+
+
+def pair_notes(timeline, shift_amount=0):
+    """Pair the note on/off events of a merged Timeline into (starts, ends, notes) arrays
+
+    A note on sounds until the next event of the same (shifted) key, whether
+    that is its note off or a note on retriggering it; a note still sounding at
+    the end lasts until the final event. Notes come out ordered by start time,
+    ties in the order the notes finished.
+    """
+    event_notes = np.clip(timeline.notes.astype(np.int64) + shift_amount, 36, 100)
+    on_events, finish_events, sounding = link_events(event_notes, timeline.is_on)
+
+    # The order keys are almost sorted already, which the stable sort
+    # (timsort) handles in near linear time
+    order = np.argsort(note_order_keys(timeline.seconds, on_events, finish_events, sounding), kind='stable')
+    on_events, finish_events, sounding = on_events[order], finish_events[order], sounding[order]
+    starts, ends = note_times(timeline.seconds, on_events, finish_events, sounding)
+    return starts, ends, event_notes[on_events]
+
+
+def build_events(starts, ends, notes):
+    """Lay out paired notes as an EVENT_DTYPE array of notes and the rests between them
+
+    Notes are ordered by start time; a rest is emitted before the first note if
+    it does not start at 0 and between notes whose start times differ by at
+    least 1 ms. Two "0.1" notes terminate the sheet.
+    """
+    order = np.argsort(starts, kind='stable')
+    starts = starts[order]
+    durations_ms = np.trunc((ends[order] - starts) * 1000).astype(np.int64)
+    keys = notes[order] - 35
+
+    gaps_ms = np.zeros(starts.size, dtype=np.int64)
+    has_gap = np.zeros(starts.size, dtype=bool)
+    if starts.size:
+        gaps_ms[0] = np.trunc(starts[0] * 1000)
+        has_gap[0] = starts[0] > 0
+        gaps_ms[1:] = np.trunc((starts[1:] - starts[:-1]) * 1000)
+        has_gap[1:] = (starts[1:] > starts[:-1]) & (gaps_ms[1:] > 0)
+
+    # Each note lands after its own optional rest
+    note_positions = np.arange(starts.size) + np.cumsum(has_gap)
+    events = np.zeros(starts.size + int(has_gap.sum()) + 2, dtype=EVENT_DTYPE)
+
+    events['kind'][note_positions[has_gap] - 1] = EVENT_REST
+    events['gap_ms'][note_positions[has_gap] - 1] = gaps_ms[has_gap]
+    events['key'][note_positions] = keys
+    events['duration_ms'][note_positions] = durations_ms
+
+    # End-of-sheet markers ("0.1")
+    events['duration_ms'][-2:] = 1
+
+    return events
+
+
+def duration_digits(duration_ms):
+    """The two hundredths digits a "key.ms" note keeps of its duration once scaled"""
+    return duration_ms * 100 // 10 ** len(str(duration_ms))
+
+
+def _pack_onset(notes):
+    # Lowest key of each duration becomes the root; keys up to CHORD_SPAN above it join its chord
+    if len(notes) < 2:
+        return notes
+    packed = []
+    root_digits, root_key, mask = None, 0, 0
+    for digits, key, duration in sorted((duration_digits(n[2]), n[1], n[2]) for n in notes):
+        interval = key - root_key
+        if digits == root_digits and 0 < interval <= CHORD_SPAN and not mask >> (interval - 1) & 1:
+            mask |= 1 << (interval - 1)
+            continue
+        if mask:
+            packed.append((EVENT_CHORD, mask, 0, 0))
+        root_digits, root_key, mask = digits, key, 0
+        packed.append((EVENT_NOTE, key, duration, 0))
+    if mask:
+        packed.append((EVENT_CHORD, mask, 0, 0))
+    return packed
+
+
+def iter_chord_events(events):
+    """Pack each run of notes that start together into root notes and chord events
+
+    events is an iterable of (kind, key, duration_ms, gap_ms) tuples as laid out
+    by build_events; notes with the same duration digits share one chord event.
+    End-of-sheet markers are passed through unpacked.
+    """
+    onset = []
+    for event in events:
+        if event[0] == EVENT_NOTE and event[1] > 0:
+            onset.append(event)
+            continue
+        yield from _pack_onset(onset)
+        onset = []
+        yield event
+    yield from _pack_onset(onset)
+
+
+def pack_chords(events):
+    """Chord-packed copy of an EVENT_DTYPE array"""
+    return np.array(list(iter_chord_events(events.tolist())), dtype=EVENT_DTYPE)
+
+
+def chord_notes(masks):
+    """Number of notes each chord event interval mask adds"""
+    bits = np.asarray(masks, dtype='>u2').reshape(-1, 1).view(np.uint8)
+    return np.unpackbits(bits, axis=1).sum(axis=1)
+
+
+def count_events(events):
+    """Return (note count, rest count) of an EVENT_DTYPE array; chord events count their notes"""
+    kinds = events['kind']
+    num_rests = int(np.count_nonzero(kinds == EVENT_REST))
+    is_chord = kinds == EVENT_CHORD
+    num_notes = len(events) - num_rests - int(is_chord.sum()) + int(chord_notes(events['key'][is_chord]).sum())
+    return num_notes, num_rests
+
+
+def events_to_values(events):
+    """Scale an EVENT_DTYPE array into the integers written by encode_values
+
+    A note "key.ms" is read as the decimal key.ms and scaled by 100 using
+    integer arithmetic, so it no longer goes through a float string; a rest
+    is -ms * 100. Notes are clamped to [0, 1048575]; rests are offset by 2^21
+    and clamped to [1048576, 2097151].
+    """
+    durations = events['duration_ms']
+    # 10 ** (number of decimal digits in the duration)
+    fraction_scale = 10 ** (np.searchsorted(DECIMAL_THRESHOLDS, durations, side='right') + 1)
+    note_values = events['key'].astype(np.int64) * 100 + durations * 100 // fraction_scale
+
+    values = np.where(events['kind'] == EVENT_REST, -events['gap_ms'] * 100, note_values)
+    values = np.where(events['kind'] == EVENT_CHORD, CHORD_BASE + events['key'].astype(np.int64), values)
+    return np.where(values < 0,
+                    np.clip(values + SCALE_OFFSET, SCALE_OFFSET // 2, SCALE_OFFSET - 1),
+                    np.minimum(values, SCALE_OFFSET // 2 - 1))
+
+
+def encode_values(values, encoding=ENCODING_FIXED):
+    """Encode scaled integers as 3-character components packed into Custom String chunks"""
+    if encoding == ENCODING_COMPACT:
+        return list(iter_packed_chunks([compact_codes(values)]))
+    if encoding == ENCODING_LZ:
+        return list(iter_packed_chunks([lz_codes(values)]))
+    if encoding != ENCODING_FIXED:
+        raise ValueError(f"Unknown sheet encoding: {encoding}")
+
+    values = np.asarray(values, dtype=np.int64)
+    if values.size == 0:
+        return []
+
+    digits = np.empty((values.size, CHARS_PER_VALUE), dtype=np.int64)
+    high, digits[:, 2] = np.divmod(values, 128)
+    digits[:, 0], digits[:, 1] = np.divmod(high, 128)
+
+    combined = CHARSET_CODES.take(digits).tobytes().decode('utf-32-le')
+    return [combined[i:i + STRING_CHUNK_CHARS] for i in range(0, len(combined), STRING_CHUNK_CHARS)]
+
+
+def compact_codes(values, rest_limit=COMPACT_REST_LIMIT):
+    """Encode scaled integers with the compact encoding
+
+    Returns (text, code_ends) where code_ends[i] is the end offset of value i's
+    code in text.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    rest = values >= SCALE_OFFSET // 2
+    rest_units = SCALE_OFFSET - values
+    gaps = rest_units // 100
+
+    short_note = ~rest & (values < COMPACT_NOTE_LIMIT)
+    short_rest = rest & (rest_units % 100 == 0) & (gaps < rest_limit)
+    short = short_note | short_rest
+    codes = np.where(short_note, values, COMPACT_NOTE_LIMIT + gaps)[short]
+
+    lengths = np.where(short, 2, CHARS_PER_VALUE + 1)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    digits = np.empty(int(ends[-1]) if ends.size else 0, dtype=np.int64)
+
+    short_starts = starts[short]
+    digits[short_starts], digits[short_starts + 1] = np.divmod(codes, 128)
+
+    escape_starts = starts[~short]
+    high, digits[escape_starts + 3] = np.divmod(values[~short], 128)
+    digits[escape_starts + 1], digits[escape_starts + 2] = np.divmod(high, 128)
+    digits[escape_starts] = COMPACT_ESCAPE
+
+    return CHARSET_CODES.take(digits).tobytes().decode('utf-32-le'), ends
+
+
+def lz_matches(values, history=()):
+    """Greedy LZ77 parse of values; returns [(start, length, distance), ...] for the back-references
+
+    Earlier occurrences of each LZ_MIN_MATCH-value window are found through hash
+    chains built with one sort. history holds values that precede values (from
+    an earlier streaming block); references may point into it but never start
+    there. Positions are relative to values.
+    """
+    data = np.concatenate((np.asarray(history, dtype=np.int64)[-LZ_WINDOW:], np.asarray(values, dtype=np.int64)))
+    base = data.size - len(values)
+    n = data.size
+    if n < LZ_MIN_MATCH:
+        return []
+
+    # Two 42-bit keys identify each window of four 21-bit values
+    m = n - LZ_MIN_MATCH + 1
+    key_a = (data[:m] << 21) | data[1:m + 1]
+    key_b = (data[2:m + 2] << 21) | data[3:m + 3]
+    order = np.lexsort((key_b, key_a))
+    same = (key_a[order[1:]] == key_a[order[:-1]]) & (key_b[order[1:]] == key_b[order[:-1]])
+    previous = np.full(m, -1, dtype=np.int64)
+    previous[order[1:][same]] = order[:-1][same]
+
+    data = data.tolist()
+    previous = previous.tolist()
+    matches = []
+    i = base
+    while i < m:
+        candidate = previous[i]
+        best_length = 0
+        best_distance = 0
+        max_length = min(LZ_MAX_MATCH, n - i)
+        depth = 0
+        while candidate >= 0 and i - candidate <= LZ_WINDOW and depth < LZ_CHAIN_DEPTH:
+            # The window matches already; extend it
+            length = LZ_MIN_MATCH
+            while length < max_length and data[candidate + length] == data[i + length]:
+                length += 1
+            if length > best_length:
+                best_length = length
+                best_distance = i - candidate
+                if length == max_length:
+                    break
+            candidate = previous[candidate]
+            depth += 1
+
+        if best_length:
+            matches.append((i - base, best_length, best_distance))
+            i += best_length
+        else:
+            i += 1
+    return matches
+
+
+def lz_codes(values, history=()):
+    """Encode scaled integers with the LZ encoding; returns (text, code_ends) like compact_codes"""
+    values = np.asarray(values, dtype=np.int64)
+    texts = []
+    ends = []
+    offset = 0
+
+    def add_literals(start, end):
+        nonlocal offset
+        if end > start:
+            text, literal_ends = compact_codes(values[start:end], LZ_REST_LIMIT)
+            texts.append(text)
+            ends.append(literal_ends + offset)
+            offset += len(text)
+
+    pos = 0
+    for start, length, distance in lz_matches(values, history):
+        add_literals(pos, start)
+        high, low = divmod(distance, 128)
+        digits = [LZ_BACKREF, high // 128, high % 128, low, length // 128, length % 128]
+        texts.append(''.join(WORKSHOP_CHARSET[d] for d in digits))
+        offset += LZ_TOKEN_CHARS
+        ends.append(np.array([offset], dtype=np.int64))
+        pos = start + length
+    add_literals(pos, values.size)
+
+    return ''.join(texts), np.concatenate(ends) if ends else np.zeros(0, dtype=np.int64)
+
+
+def iter_packed_chunks(code_blocks, chunk_chars=STRING_CHUNK_CHARS):
+    """Pack (text, code_ends) blocks into Custom String chunks that never split a code"""
+    pending = ''
+    pending_ends = np.zeros(0, dtype=np.int64)
+    for text, ends in code_blocks:
+        text = pending + text
+        ends = np.concatenate((pending_ends, np.asarray(ends, dtype=np.int64) + len(pending)))
+
+        start = 0
+        while len(text) - start > chunk_chars:
+            end = int(ends[np.searchsorted(ends, start + chunk_chars, side='right') - 1])
+            yield text[start:end]
+            start = end
+
+        pending = text[start:]
+        pending_ends = ends[np.searchsorted(ends, start, side='right'):] - start
+    if pending:
+        yield pending
+
+
+def size_report(values, encodings=tuple(ENCODING_IDS)):
+    """Characters and Custom Strings each encoding needs for the same values"""
+    report = {}
+    for encoding in encodings:
+        strings = encode_values(values, encoding)
+        report[encoding] = {'chars': sum(len(s) for s in strings), 'strings': len(strings)}
+    return report
+
+
+def format_size_report(report, encoding):
+    """Describe the size of encoding relative to the fixed encoding"""
+    size = report[encoding]
+    text = f"{size['strings']} strings, {size['chars']} characters"
+    fixed = report.get(ENCODING_FIXED)
+    if encoding != ENCODING_FIXED and fixed and fixed['strings']:
+        text += f" ({(1 - size['strings'] / fixed['strings']) * 100:.0f}% fewer strings than fixed)"
+    return text
+
+
+def _format_chord(mask):
+    return "".join(f"+{i + 1}" for i in range(CHORD_SPAN) if mask >> i & 1)
+
+
+def format_events(events):
+    """Format an EVENT_DTYPE array back into "key.ms" / "-ms" strings
+
+    A chord event is written as the intervals it adds above the previous
+    note, e.g. "+4+7".
+    """
+    return [f"-{gap}" if kind == EVENT_REST else _format_chord(key) if kind == EVENT_CHORD else f"{key}.{duration}"
+            for kind, key, duration, gap in events.tolist()]
+
+
+def _charset_digits(text):
+    """Map characters to digits; characters outside the charset decode as 0"""
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype='<u4')
+    return CHARSET_LOOKUP[np.minimum(codes, CHARSET_LOOKUP.size - 1)]
+
+
+def decode_values(compressed_data, num_events, encoding=ENCODING_FIXED):
+    """Decode the first num_events 3-character components back into scaled integers"""
+    if encoding == ENCODING_COMPACT:
+        return decode_compact_values(compressed_data, num_events)
+    if encoding == ENCODING_LZ:
+        return decode_lz_values(compressed_data, num_events)
+    if encoding != ENCODING_FIXED:
+        raise ValueError(f"Unknown sheet encoding: {encoding}")
+
+    combined = ''.join(compressed_data)[:num_events * CHARS_PER_VALUE]
+    digits = _charset_digits(combined)
+
+    # A trailing partial component decodes as if it were left-padded with zeros
+    remainder = digits.size % CHARS_PER_VALUE
+    if remainder:
+        padding = np.zeros(CHARS_PER_VALUE - remainder, dtype=digits.dtype)
+        digits = np.concatenate((digits[:-remainder], padding, digits[-remainder:]))
+
+    digits = digits.reshape(-1, CHARS_PER_VALUE)
+    return (digits[:, 0] * 128 + digits[:, 1]) * 128 + digits[:, 2]
+
+
+def decode_compact_values(compressed_data, num_events, back_references=False):
+    """Decode the first num_events compact (or LZ) codes back into scaled integers"""
+    digits = _charset_digits(''.join(compressed_data))
+    # Missing trailing digits of a truncated code decode as 0
+    digits = np.concatenate((digits, np.zeros(LZ_TOKEN_CHARS, dtype=digits.dtype)))
+    size = digits.size - LZ_TOKEN_CHARS
+
+    # Codes are two digits long until an escape (or back-reference) digit starts
+    # a longer one; only such digits at an even distance from the current
+    # position can start a code
+    long_first = COMPACT_ESCAPE if not back_references else LZ_BACKREF
+    longs = np.flatnonzero(digits[:size] >= long_first)
+    longs_by_parity = (longs[longs % 2 == 0], longs[longs % 2 == 1])
+
+    pieces = []  # value arrays, or (distance, length) back-references
+    count = 0
+    pos = 0
+    while pos < size and count < num_events:
+        candidates = longs_by_parity[pos % 2]
+        k = np.searchsorted(candidates, pos)
+        long_start = int(candidates[k]) if k < candidates.size else size
+
+        starts = np.arange(pos, long_start, 2)[:num_events - count]
+        codes = digits[starts] * 128 + digits[starts + 1]
+        pieces.append(np.where(codes < COMPACT_NOTE_LIMIT, codes,
+                               SCALE_OFFSET - (codes - COMPACT_NOTE_LIMIT) * 100))
+        count += starts.size
+        if long_start >= size or count >= num_events:
+            break
+
+        d = digits[long_start:long_start + LZ_TOKEN_CHARS].tolist()
+        if d[0] == COMPACT_ESCAPE:
+            pieces.append(np.array([(d[1] * 128 + d[2]) * 128 + d[3]], dtype=np.int64))
+            count += 1
+            pos = long_start + CHARS_PER_VALUE + 1
+        else:
+            length = d[4] * 128 + d[5]
+            pieces.append(((d[1] * 128 + d[2]) * 128 + d[3], length))
+            count += length
+            pos = long_start + LZ_TOKEN_CHARS
+
+    if not back_references:
+        return np.concatenate(pieces)[:num_events] if pieces else np.zeros(0, dtype=np.int64)
+
+    # Expand back-references; a reference may overlap the values it produces
+    values = np.zeros(count, dtype=np.int64)
+    out = 0
+    for piece in pieces:
+        if isinstance(piece, tuple):
+            distance, length = piece
+            source = max(out - distance, 0)
+            if out - source >= length:
+                values[out:out + length] = values[source:source + length]
+            elif out > source:
+                values[out:out + length] = np.resize(values[source:out], length)
+            out += length
+        else:
+            values[out:out + piece.size] = piece
+            out += piece.size
+    return values[:num_events]
+
+
+def decode_lz_values(compressed_data, num_events):
+    """Decode the first num_events values of an LZ encoded sheet"""
+    return decode_compact_values(compressed_data, num_events, back_references=True)
+
+
+def values_to_events(values):
+    """Turn decoded scaled integers into an EVENT_DTYPE array"""
+    values = np.asarray(values, dtype=np.int64)
+    events = np.zeros(values.size, dtype=EVENT_DTYPE)
+
+    # Values in the upper half are rests stored as -ms * 100 + 2^21
+    rest = values >= SCALE_OFFSET // 2
+    events['kind'][rest] = EVENT_REST
+    events['gap_ms'][rest] = np.round(np.abs((values[rest] - SCALE_OFFSET) / 100.0))
+
+    chord = ~rest & (values >= CHORD_BASE) & (values < CHORD_BASE + (1 << CHORD_SPAN))
+    events['kind'][chord] = EVENT_CHORD
+    events['key'][chord] = values[chord] - CHORD_BASE
+
+    note = ~rest & ~chord
+    note_values = values[note] / 100.0
+    keys = np.trunc(note_values)
+    events['key'][note] = keys
+    events['duration_ms'][note] = np.round((note_values - keys) * 1000)
+
+    return events
+
+
+def decode_events(compressed_data, num_events, encoding=ENCODING_FIXED):
+    """Decompress events into an EVENT_DTYPE array"""
+    return values_to_events(decode_values(compressed_data, num_events, encoding))
+
+
+def timing_errors(original, decompressed):
+    """Per-event timing difference in ms (duration for notes, gap for rests) between two EVENT_DTYPE arrays"""
+    compare_limit = min(len(original), len(decompressed))
+    a = original[:compare_limit]
+    b = decompressed[:compare_limit]
+    errors = np.where(a['kind'] == EVENT_REST, b['gap_ms'] - a['gap_ms'], b['duration_ms'] - a['duration_ms'])
+    return errors[(a['kind'] == b['kind']) & (a['kind'] != EVENT_CHORD)]
+
+
+def error_distribution(errors_ms):
+    """Summary of absolute timing errors: count, mean, median, 90th/99th percentile and max in ms"""
+    errors = np.abs(np.asarray(errors_ms, dtype=np.float64))
+    if errors.size == 0:
+        return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p90': 0.0, 'p99': 0.0, 'max': 0.0}
+    p50, p90, p99 = np.percentile(errors, [50, 90, 99])
+    return {'count': int(errors.size), 'mean': float(errors.mean()), 'p50': float(p50), 'p90': float(p90),
+            'p99': float(p99), 'max': float(errors.max())}
+
+
+def format_error_distribution(distribution):
+    """One-line summary such as "mean 1.2 ms, median 0.0 ms, p90 4.0 ms, p99 9.5 ms, max 12.0 ms" """
+    return (f"mean {distribution['mean']:.1f} ms, median {distribution['p50']:.1f} ms, "
+            f"p90 {distribution['p90']:.1f} ms, p99 {distribution['p99']:.1f} ms, max {distribution['max']:.1f} ms")
+
+
+def compare_events(original, decompressed, tolerance_ms=10):
+    """Compare two EVENT_DTYPE arrays
+
+    Returns (match_count, diff_positions, compare_limit); events match when they
+    are the same kind, notes share a key and times differ by less than tolerance_ms.
+    """
+    compare_limit = min(len(original), len(decompressed))
+    a = original[:compare_limit]
+    b = decompressed[:compare_limit]
+
+    same_kind = a['kind'] == b['kind']
+    note_match = ((a['kind'] == EVENT_NOTE) & (a['key'] == b['key'])
+                  & (np.abs(a['duration_ms'] - b['duration_ms']) < tolerance_ms))
+    rest_match = (a['kind'] == EVENT_REST) & (np.abs(a['gap_ms'] - b['gap_ms']) < tolerance_ms)
+    chord_match = (a['kind'] == EVENT_CHORD) & (a['key'] == b['key'])
+    matched = same_kind & (note_match | rest_match | chord_match)
+
+    return int(matched.sum()), np.flatnonzero(~matched), compare_limit
+
+
+def write_workshop_code(fp, compressed_strings, rule_name, subroutine_id=DEFAULT_SUBROUTINE_ID, bpm=DEFAULT_BPM,
+                        encoding=ENCODING_FIXED):
+    """Write the workshop rule to a file-like object
+
+    compressed_strings may be any iterable (including a generator); strings are
+    written five per line as they arrive.
+    """
+    sheet_format = ""
+    if encoding != ENCODING_FIXED:
+        sheet_format = f"\n        Event Player.SheetFormat = {ENCODING_IDS[encoding]};"
+
+    fp.write(f"""Rule("{rule_name}")
+{{
+    Event
+    {{
+        Subroutine;
+        S{subroutine_id};
+    }}
+    Action
+    {{
+        Event Player.Tempo = {bpm};{sheet_format}
+        Event Player.Sheet = Array(
+""")
+
+    prefix = "\t\t"
+    line = []
+    for s in compressed_strings:
+        line.append(f'Custom String("{s}")')
+        if len(line) == 5:
+            fp.write(prefix + ", ".join(line))
+            prefix = ",\n\t\t"
+            line = []
+    if line:
+        fp.write(prefix + ", ".join(line))
+
+    fp.write(""");
+    }
+}""")
+
+
+def generate_workshop_code(compressed_strings, rule_name, subroutine_id=DEFAULT_SUBROUTINE_ID, bpm=DEFAULT_BPM,
+                           encoding=ENCODING_FIXED):
+    """Generate workshop code"""
+    buffer = io.StringIO()
+    write_workshop_code(buffer, compressed_strings, rule_name, subroutine_id, bpm, encoding)
+    return buffer.getvalue()
+
+
+def save_workshop_code(path, compressed_strings, rule_name, subroutine_id=DEFAULT_SUBROUTINE_ID, bpm=DEFAULT_BPM,
+                       encoding=ENCODING_FIXED):
+    """Stream the workshop rule straight to a file through a large write buffer"""
+    with open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_BYTES) as fp:
+        write_workshop_code(fp, compressed_strings, rule_name, subroutine_id, bpm, encoding)
+
+
+def convert_file(filepath, shift_amount=0, selected_tracks=None, subroutine_id=DEFAULT_SUBROUTINE_ID, song=None,
+                 fast_reader=True, encoding=ENCODING_FIXED, chords=False, quantize=0,
+                 max_error_ms=QUANTIZE_MAX_ERROR_MS):
+    """Run the full convert -> compress -> workshop code pipeline on one file
+
+    Pass an already loaded song to skip parsing the file again. With chords=True
+    notes that start together are packed into chord events. quantize > 0 snaps
+    note starts and ends to a 1/quantize beat grid wherever that moves them by
+    at most max_error_ms; the result's timing_errors_ms holds every shift.
+    """
+    if song is None:
+        song = LoadedSong.load(filepath, fast_reader)
+
+    if not selected_tracks:
+        selected_tracks = list(range(len(song.tracks)))
+
+    timeline = song.timeline(selected_tracks)
+    with span('pair'):
+        starts, ends, notes = pair_notes(timeline, shift_amount)
+    return convert_notes(starts, ends, notes, song, filepath, subroutine_id, encoding, chords, quantize, max_error_ms)
+
+
+def convert_notes(starts, ends, notes, song, filepath, subroutine_id=DEFAULT_SUBROUTINE_ID, encoding=ENCODING_FIXED,
+                  chords=False, quantize=0, max_error_ms=QUANTIZE_MAX_ERROR_MS):
+    """The layout -> compress -> workshop code half of convert_file, for notes paired by pair_notes"""
+    with span('convert'):
+        timing_errors_ms = np.zeros(0)
+        if quantize:
+            grid = TimingGrid(song.tempo_map, quantize, max_error_ms)
+            starts, ends, timing_errors_ms = grid.snap_notes(starts, ends)
+        converted_data = build_events(starts, ends, notes)
+        if chords:
+            converted_data = pack_chords(converted_data)
+    with span('compress'):
+        compressed_strings = encode_values(events_to_values(converted_data), encoding)
+
+    rule_name = os.path.splitext(os.path.basename(filepath))[0]
+    bpm = song.bpm
+    with span('workshop'):
+        workshop_code = generate_workshop_code(compressed_strings, rule_name, subroutine_id, bpm, encoding)
+
+    return {
+        'raw_data': converted_data,
+        'compressed_strings': compressed_strings,
+        'workshop_code': workshop_code,
+        'encoding': encoding,
+        'chords': chords,
+        'timing_errors_ms': timing_errors_ms,
+        'bpm': bpm,
+        'num_events': len(converted_data),
+        'num_notes': count_events(converted_data)[0],
+    }
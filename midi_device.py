@@ -0,0 +1,117 @@
+"""Persistent pygame.midi output port shared by every playback.
+
+pygame.midi device enumeration and Output() construction are slow on some
+systems, so the pool enumerates the output ports once, opens the chosen port
+on first use and keeps it open across play, seek and stop. The port is only
+closed and reopened after a write fails (invalidate) or when another port is
+selected. PortMidi fixes its device list when it is initialized, so a failure
+or a refresh restarts pygame.midi, and an explicitly selected port is found
+again by name. pygame is imported on first use so it costs nothing at startup.
+"""
+import logging
+import threading
+
+
+class MidiOutputPool:
+    """Lazily opened, long-lived MIDI output port"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.outputs = None  # [(device_id, name), ...] once enumerated
+        self.selected_id = None  # explicit port choice, None = first port that opens
+        self.selected_name = None  # name of the chosen port; device ids change when devices come and go
+        self.output = None
+        self.output_id = None
+        self.midi = None  # pygame.midi, once imported
+        self.initialized = False
+
+    def _ensure_init(self):
+        if not self.initialized:
+            if self.midi is None:
+                import pygame.midi
+                self.midi = pygame.midi
+            self.midi.init()
+            self.initialized = True
+
+    def list_outputs(self, refresh=False):
+        """Return the output ports as [(device_id, name), ...]
+
+        Ports are enumerated only on the first call or when refresh is True;
+        refreshing restarts pygame.midi so newly attached devices show up.
+        """
+        with self.lock:
+            if refresh:
+                self._restart()
+
+            if self.outputs is None:
+                self._ensure_init()
+                self.outputs = []
+                for i in range(self.midi.get_count()):
+                    info = self.midi.get_device_info(i)
+                    if info and info[3] == 1:  # Output device
+                        self.outputs.append((i, info[1].decode('utf-8', 'replace')))
+                if self.selected_name is not None:
+                    self.selected_id = next((device_id for device_id, name in self.outputs
+                                             if name == self.selected_name), self.selected_id)
+            return list(self.outputs)
+
+    def select(self, device_id):
+        """Use device_id for playback (None picks the first port that opens)"""
+        with self.lock:
+            if device_id == self.selected_id:
+                return
+            self.selected_id = device_id
+            self.selected_name = dict(self.outputs or ()).get(device_id)
+            if self.output_id != device_id:
+                self._close_output()
+
+    def get(self):
+        """Return the open output port, opening it if needed; None when no port works"""
+        with self.lock:
+            if self.output is not None:
+                return self.output
+
+            outputs = self.list_outputs()
+            candidates = [device_id for device_id, _ in outputs]
+            if self.selected_id is not None:
+                candidates = [self.selected_id] + [i for i in candidates if i != self.selected_id]
+
+            for device_id in candidates:
+                try:
+                    self.output = self.midi.Output(device_id)
+                    self.output_id = device_id
+                    logging.info(f"Opened MIDI output {device_id}")
+                    return self.output
+                except Exception as e:
+                    logging.warning(f"Failed to open MIDI output {device_id}: {e}")
+            return None
+
+    def invalidate(self):
+        """Drop the current port after a failure; the next get() restarts pygame.midi and reconnects"""
+        with self.lock:
+            self._restart()
+
+    def close(self):
+        """Close the port and shut down pygame.midi"""
+        with self.lock:
+            self._close_output()
+            if self.initialized:
+                self.midi.quit()
+                self.initialized = False
+
+    def _restart(self):
+        # Close the port and shut down pygame.midi so the next enumeration sees current devices
+        self._close_output()
+        if self.initialized:
+            self.midi.quit()
+            self.initialized = False
+        self.outputs = None
+
+    def _close_output(self):
+        if self.output is not None:
+            try:
+                self.output.close()
+            except Exception:
+                pass
+        self.output = None
+        self.output_id = None
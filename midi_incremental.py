@@ -0,0 +1,179 @@
+"""Incremental re-conversion while the pitch shift or track selection changes.
+
+IncrementalConverter keeps the merged timeline of the current selection and
+its notes paired per original key (midi_core.link_events). Pairing by the
+shifted key only differs where the clamp to 36-100 lands several original
+keys on the same key, so
+
+- a shift change re-applies the transpose and clamp, and re-pairs only the
+  events of the keys the clamp merges (none for most shifts),
+- ticking or unticking one track splices its events into or out of the merged
+  timeline with searchsorted and re-pairs only the keys that track plays,
+
+before the layout, chord packing, quantization and encoding stages run again.
+Changing several tracks at once rebuilds the selection. The result is
+identical to midi_core.convert_file with the same settings.
+"""
+import threading
+
+import numpy as np
+
+import midi_core
+from midi_metrics import span
+
+TIMELINE_COLUMNS = ('ticks', 'seconds', 'notes', 'velocities', 'is_on', 'tracks')
+
+
+def track_timeline(song, track_index):
+    """The note events of one track as a Timeline, with their times in seconds"""
+    track = song.tracks[track_index]
+    return midi_core.Timeline(track.ticks,
+                              song.tempo_map.ticks_to_seconds(track.ticks),
+                              track.notes,
+                              track.velocities,
+                              track.is_on,
+                              np.full(len(track.ticks), track_index, dtype=np.int64))
+
+
+def link_subset(timeline, events, keys):
+    """midi_core.link_events on the events at indices events, with the indices mapped back to timeline"""
+    on_events, finish_events, sounding = midi_core.link_events(keys, timeline.is_on[events])
+    return events[on_events], events[finish_events], sounding
+
+
+def merge_links(seconds, *links):
+    """Combine (on_events, finish_events, sounding) note sets into note order
+
+    The first set is usually in order already and the rest small, which the
+    stable sort (timsort) merges in near linear time.
+    """
+    on_events, finish_events, sounding = (np.concatenate(columns) for columns in zip(*links))
+    order = np.argsort(midi_core.note_order_keys(seconds, on_events, finish_events, sounding), kind='stable')
+    return on_events[order], finish_events[order], sounding[order]
+
+
+class IncrementalConverter:
+    """Converts one song repeatedly, reusing the merged timeline and note pairing between runs
+
+    convert() may be called from a worker thread; calls are serialized.
+    """
+
+    def __init__(self, song, filepath):
+        self.song = song
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.track_timelines = {}  # track index -> Timeline of that track alone
+        self.track_span = max(len(song.tracks), 1)
+        self.selection = frozenset()
+        self._rebuild(self.selection)
+
+    def _track_timeline(self, track_index):
+        timeline = self.track_timelines.get(track_index)
+        if timeline is None:
+            timeline = track_timeline(self.song, track_index)
+            self.track_timelines[track_index] = timeline
+        return timeline
+
+    def _set_links(self, links):
+        # Notes paired per original key, in note order, and their times
+        self.links = links
+        on_events = links[0]
+        self.paired = midi_core.note_times(self.merged.seconds, *links) + (self.merged.notes[on_events],)
+
+    def _set_timeline(self, timeline):
+        self.merged = timeline
+        # Merge order: tick, then track
+        self.merge_keys = timeline.ticks * self.track_span + timeline.tracks
+        self.note_counts = np.bincount(timeline.notes, minlength=128)
+
+    def _rebuild(self, selection):
+        self._set_timeline(self.song.timeline(selection))
+        self._set_links(merge_links(self.merged.seconds,
+                                    midi_core.link_events(self.merged.notes, self.merged.is_on)))
+
+    def _splice(self, timeline, new_index, affected):
+        # Switch to timeline, where new_index maps the old event indices that
+        # remain; notes of affected keys are paired again, the rest are kept
+        on_events, finish_events, sounding = self.links
+        keep = ~affected[self.merged.notes[on_events]]
+        kept = (new_index[on_events[keep]], new_index[finish_events[keep]], sounding[keep])
+
+        self._set_timeline(timeline)
+        events = np.flatnonzero(affected[timeline.notes])
+        self._set_links(merge_links(timeline.seconds, kept, link_subset(timeline, events, timeline.notes[events])))
+
+    def _add_track(self, track_index):
+        added = self._track_timeline(track_index)
+        size = len(self.merged) + len(added)
+        positions = np.searchsorted(self.merge_keys, added.ticks * self.track_span + track_index)
+        positions += np.arange(len(added))
+        is_added = np.zeros(size, dtype=bool)
+        is_added[positions] = True
+        new_index = np.flatnonzero(~is_added)
+
+        columns = {}
+        for name in TIMELINE_COLUMNS:
+            column = np.empty(size, dtype=getattr(self.merged, name).dtype)
+            column[positions] = getattr(added, name)
+            column[new_index] = getattr(self.merged, name)
+            columns[name] = column
+        self._splice(midi_core.Timeline(**columns), new_index, np.bincount(added.notes, minlength=128) > 0)
+
+    def _remove_track(self, track_index):
+        keep = self.merged.tracks != track_index
+        affected = np.bincount(self.merged.notes[~keep], minlength=128) > 0
+        new_index = np.cumsum(keep) - 1
+        timeline = midi_core.Timeline(**{name: getattr(self.merged, name)[keep] for name in TIMELINE_COLUMNS})
+        self._splice(timeline, new_index, affected)
+
+    def select(self, selected_tracks):
+        """Update the merged timeline and pairing to the selected tracks"""
+        selection = frozenset(i for i in selected_tracks if 0 <= i < len(self.song.tracks))
+        removed = self.selection - selection
+        added = selection - self.selection
+        if len(removed) + len(added) > 1 or not self.selection:
+            if removed or added:
+                self._rebuild(selection)
+        elif removed:
+            self._remove_track(next(iter(removed)))
+        elif added:
+            self._add_track(next(iter(added)))
+        self.selection = selection
+
+    def shifted_notes(self, shift_amount):
+        """(starts, ends, notes) of the selection as midi_core.pair_notes pairs them for shift_amount"""
+        starts, ends, notes = self.paired
+
+        # Original keys the clamp lands on the same key have to be paired together
+        present = np.flatnonzero(self.note_counts)
+        affected = np.zeros(128, dtype=bool)
+        for clamped in (present[present + shift_amount <= 36], present[present + shift_amount >= 100]):
+            if clamped.size > 1:
+                affected[clamped] = True
+
+        if affected.any():
+            on_events, finish_events, sounding = self.links
+            keep = ~affected[notes]
+            events = np.flatnonzero(affected[self.merged.notes])
+            keys = np.clip(self.merged.notes[events].astype(np.int64) + shift_amount, 36, 100)
+            links = merge_links(self.merged.seconds, (on_events[keep], finish_events[keep], sounding[keep]),
+                                link_subset(self.merged, events, keys))
+            starts, ends = midi_core.note_times(self.merged.seconds, *links)
+            notes = self.merged.notes[links[0]]
+
+        return starts, ends, np.clip(notes.astype(np.int64) + shift_amount, 36, 100)
+
+    def convert(self, shift_amount=0, selected_tracks=None, subroutine_id=midi_core.DEFAULT_SUBROUTINE_ID,
+                encoding=midi_core.ENCODING_FIXED, chords=False, quantize=0,
+                max_error_ms=midi_core.QUANTIZE_MAX_ERROR_MS):
+        """Same arguments and result as midi_core.convert_file"""
+        if not selected_tracks:
+            selected_tracks = range(len(self.song.tracks))
+
+        with self.lock:
+            with span('merge'):
+                self.select(selected_tracks)
+            with span('pair'):
+                starts, ends, notes = self.shifted_notes(shift_amount)
+            return midi_core.convert_notes(starts, ends, notes, self.song, self.filepath, subroutine_id,
+                                           encoding, chords, quantize, max_error_ms)
@@ -0,0 +1,79 @@
+"""Background MIDI file loading with progress reporting and cancellation.
+
+The loader parses a file into a midi_core.LoadedSong on a worker thread and
+posts messages to a queue for the UI thread to drain:
+
+    ('progress', token, bytes_read, total_bytes, tracks_read, num_tracks)
+    ('done', token, LoadedInfo)
+    ('error', token, exception)
+
+Starting a new load cancels the one in flight; a cancelled load posts nothing
+more, so a stale result can never overwrite a newer selection. The token
+identifies which load a message belongs to.
+"""
+import queue
+import threading
+
+import midi_core
+import midi_metrics
+
+
+class LoadCancelled(Exception):
+    """Raised inside a worker whose load was superseded"""
+
+
+class LoadedInfo:
+    """A loaded song with the values the UI shows, computed off the UI thread"""
+
+    def __init__(self, path, song, metrics=()):
+        self.path = path
+        self.song = song
+        self.metrics = list(metrics)
+        self.bpm = song.bpm
+        self.duration = song.duration
+        self.track_names = song.track_names
+
+
+class BackgroundLoader:
+    """Loads one MIDI file at a time on a daemon thread"""
+
+    def __init__(self, messages=None):
+        self.messages = messages if messages is not None else queue.Queue()
+        self.token = 0
+        self.cancel_event = None
+
+    def start(self, path):
+        """Cancel any load in flight and start loading path; returns its token"""
+        self.cancel()
+        self.token += 1
+        self.cancel_event = threading.Event()
+        threading.Thread(target=self._run, args=(path, self.token, self.cancel_event), daemon=True).start()
+        return self.token
+
+    def cancel(self):
+        """Cancel the load in flight, if any"""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.cancel_event = None
+
+    def _run(self, path, token, cancel_event):
+        def progress(bytes_read, total_bytes, tracks_read, num_tracks):
+            if cancel_event.is_set():
+                raise LoadCancelled()
+            self.messages.put(('progress', token, bytes_read, total_bytes, tracks_read, num_tracks))
+
+        try:
+            with midi_metrics.collect() as metrics:
+                song = midi_core.LoadedSong.load(path, progress=progress)
+                # Build the all-tracks timeline now so the first Play starts immediately
+                song.timeline(range(len(song.tracks)))
+            info = LoadedInfo(path, song, metrics)
+        except LoadCancelled:
+            return
+        except Exception as e:
+            if not cancel_event.is_set():
+                self.messages.put(('error', token, e))
+            return
+
+        if not cancel_event.is_set():
+            self.messages.put(('done', token, info))
@@ -0,0 +1,129 @@
+"""Named timing/memory spans for the conversion pipeline and playback.
+
+Wrap a stage in `with span('convert'):` and its wall time (and, when memory
+tracing is on, its tracemalloc peak) is recorded without any other wiring:
+
+    with collect() as records:
+        with span('load'):
+            ...
+    print(format_records(records))
+
+Spans nest; a parent's peak includes its children. Every record also goes to
+a bounded global history, and is logged as one JSON line on the
+"midi_metrics" logger when JSON logging is on. Both switches default from the
+environment (MIDI_CONVERTER_TRACE_MEMORY=1, MIDI_CONVERTER_METRICS_JSON=1) and
+can be changed with configure(). tracemalloc is process wide, so peaks of
+spans running concurrently on different threads overlap.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+HISTORY_SIZE = 256
+
+logger = logging.getLogger('midi_metrics')
+
+_settings = {
+    'trace_memory': os.environ.get('MIDI_CONVERTER_TRACE_MEMORY') == '1',
+    'json_log': os.environ.get('MIDI_CONVERTER_METRICS_JSON') == '1',
+}
+_history = deque(maxlen=HISTORY_SIZE)
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def configure(trace_memory=None, json_log=None):
+    """Turn memory tracing and JSON log records on or off"""
+    if trace_memory is not None:
+        _settings['trace_memory'] = trace_memory
+        if not trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+    if json_log is not None:
+        _settings['json_log'] = json_log
+
+
+def _state():
+    if not hasattr(_local, 'spans'):
+        _local.spans = []  # open span frames: [name, start_current, peak]
+        _local.collectors = []
+    return _local
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block and record it under name"""
+    state = _state()
+    trace = _settings['trace_memory']
+    frame = None
+    if trace:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        for parent in state.spans:
+            parent[2] = max(parent[2], peak)
+        tracemalloc.reset_peak()
+        frame = [name, current, current]
+        state.spans.append(frame)
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        fields = {}
+        if frame is not None:
+            _, peak = tracemalloc.get_traced_memory()
+            frame[2] = max(frame[2], peak)
+            state.spans.remove(frame)
+            for parent in state.spans:
+                parent[2] = max(parent[2], frame[2])
+            fields['peak_mb'] = (frame[2] - frame[1]) / (1024 * 1024)
+        record(name, seconds=seconds, **fields)
+
+
+def record(name, **fields):
+    """Record a measurement that is not a timed block, e.g. playback statistics"""
+    entry = {'name': name, 'time': time.time(), **fields}
+    with _lock:
+        _history.append(entry)
+    for records in _state().collectors:
+        records.append(entry)
+    if _settings['json_log']:
+        logger.info(json.dumps(entry))
+    return entry
+
+
+@contextmanager
+def collect():
+    """Collect the records made on this thread inside the block into a list"""
+    records = []
+    collectors = _state().collectors
+    collectors.append(records)
+    try:
+        yield records
+    finally:
+        collectors.remove(records)
+
+
+def history():
+    """The most recent records from all threads, oldest first"""
+    with _lock:
+        return list(_history)
+
+
+def format_records(records):
+    """One-line summary such as "load 12 ms (1.5 MB) | convert 40 ms" """
+    parts = []
+    for entry in records:
+        if 'seconds' not in entry:
+            continue
+        text = f"{entry['name']} {entry['seconds'] * 1000:.0f} ms"
+        if 'peak_mb' in entry:
+            text += f" ({entry['peak_mb']:.1f} MB)"
+        parts.append(text)
+    return " | ".join(parts)
@@ -0,0 +1,162 @@
+"""Deadline-driven event scheduler for MIDI preview playback.
+
+The scheduler walks a sorted list of absolute event times, sleeps on a
+condition variable until the next deadline (or the next progress report) and
+hands every event that has become due to a dispatch callback as one batch.
+Pause, resume, stop and mute changes call wake() so the thread reacts at once
+instead of polling. It has no audio dependencies so it can be driven against
+a null output.
+"""
+import bisect
+import threading
+import time
+
+
+class PlaybackScheduler:
+    """Dispatch events at their deadlines on a monotonic clock
+
+    event_times must be sorted seconds. dispatch(start, end) is called with the
+    index range of the events that are due. is_paused and is_stopped are
+    callables polled only when the scheduler wakes up.
+    """
+
+    def __init__(self, event_times, dispatch, is_paused, is_stopped,
+                 on_progress=None, progress_interval=0.1, late_threshold=0.005, clock=time.monotonic):
+        self.event_times = event_times
+        self.dispatch = dispatch
+        self.is_paused = is_paused
+        self.is_stopped = is_stopped
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.late_threshold = late_threshold
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.position = 0.0
+
+        # Statistics
+        self.wakeups = 0
+        self.batches = 0
+        self.events_sent = 0
+        self.late_events = 0
+        self.max_lateness = 0.0
+
+    def wake(self):
+        """Wake the scheduler so it re-checks pause/stop state immediately"""
+        with self.condition:
+            self.condition.notify_all()
+
+    def run(self, start_position=0.0):
+        """Play from start_position until the last event, or until stopped
+
+        Returns True when every event was dispatched.
+        """
+        times = self.event_times
+        num_events = len(times)
+        index = bisect.bisect_left(times, start_position)
+        self.position = start_position
+        origin = self.clock() - start_position
+        next_progress = 0.0
+
+        while index < num_events:
+            if self.is_stopped():
+                return False
+
+            if self.is_paused():
+                # Hold the position while paused and continue from it on resume
+                paused_at = self.clock() - origin
+                with self.condition:
+                    while self.is_paused() and not self.is_stopped():
+                        self.condition.wait()
+                        self.wakeups += 1
+                origin = self.clock() - paused_at
+                continue
+
+            now = self.clock() - origin
+            self.position = now
+
+            due_end = bisect.bisect_right(times, now, index)
+            if due_end > index:
+                lateness = now - times[index]
+                if lateness > self.max_lateness:
+                    self.max_lateness = lateness
+                if lateness > self.late_threshold:
+                    self.late_events += bisect.bisect_left(times, now - self.late_threshold, index, due_end) - index
+
+                self.dispatch(index, due_end)
+                self.batches += 1
+                self.events_sent += due_end - index
+                index = due_end
+                if index >= num_events:
+                    break
+
+            if self.on_progress is not None and now >= next_progress:
+                self.on_progress(now)
+                next_progress = now + self.progress_interval
+
+            deadline = times[index]
+            if self.on_progress is not None:
+                deadline = min(deadline, next_progress)
+
+            with self.condition:
+                # Re-check under the lock so a wake() between the checks above and the wait is not lost
+                timeout = deadline - (self.clock() - origin)
+                if timeout > 0 and not self.is_paused() and not self.is_stopped():
+                    self.condition.wait(timeout)
+                    self.wakeups += 1
+
+        self.position = times[-1] if num_events else start_position
+        if self.on_progress is not None:
+            self.on_progress(self.position)
+        return True
+
+    def stats(self):
+        """Scheduler statistics as a dict"""
+        return {
+            'wakeups': self.wakeups,
+            'batches': self.batches,
+            'events_sent': self.events_sent,
+            'late_events': self.late_events,
+            'max_lateness_ms': self.max_lateness * 1000,
+        }
+
+
+class ActiveNotes:
+    """Sounding notes per track, kept as 128-bit integer bitsets
+
+    Setting and clearing a note is O(1) regardless of polyphony, and the
+    sounding notes of a track can be listed without scanning all 128 keys.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bits = {}
+
+    def note_on(self, track, note):
+        with self.lock:
+            self.bits[track] = self.bits.get(track, 0) | (1 << note)
+
+    def note_off(self, track, note):
+        with self.lock:
+            bits = self.bits.get(track)
+            if bits:
+                self.bits[track] = bits & ~(1 << note)
+
+    def pop_track(self, track):
+        """Forget and return the sounding notes of one track"""
+        with self.lock:
+            return _bit_indices(self.bits.pop(track, 0))
+
+    def pop_all(self):
+        """Forget and return {track: [notes]} for every track with sounding notes"""
+        with self.lock:
+            bits, self.bits = self.bits, {}
+        return {track: _bit_indices(b) for track, b in bits.items() if b}
+
+
+def _bit_indices(bits):
+    indices = []
+    while bits:
+        low = bits & -bits
+        indices.append(low.bit_length() - 1)
+        bits ^= low
+    return indices
@@ -0,0 +1,309 @@
+"""Streaming conversion pipeline for very large MIDI files.
+
+Every stage is a generator: merged note events -> timed events -> paired notes
+-> keyboard events -> encoded Custom String chunks -> workshop code written
+straight to the output file. The file is memory-mapped and each selected track
+is walked in blocks by smf_reader, so the memory held is a block per track
+plus the notes of the last max_hold_seconds, not a function of the file size.
+
+With the fixed and compact encodings the output is identical to
+midi_core.convert_file. The lz encoder only finds matches within a block, so
+its strings can differ while decoding to the same values. Either way a note
+sounding longer than max_hold_seconds (a drone, or a note whose note off is
+missing) is ended after max_hold_seconds instead of buffering every later note
+until it finishes; the number of notes ended this way is reported. Files
+smf_reader cannot parse fall back to mido, which holds the whole parsed file.
+"""
+import heapq
+import logging
+import os
+
+import numpy as np
+
+import midi_core
+import smf_reader
+
+# Events converted per tempo-map / encoder call; a multiple of the 42 values
+# in a Custom String so chunk boundaries line up with the in-memory encoder
+BLOCK_VALUES = (midi_core.STRING_CHUNK_CHARS // midi_core.CHARS_PER_VALUE) * 256
+
+# Track chunk data walked per read; a note event takes at least 3 bytes
+READ_BLOCK_BYTES = 64 * 1024
+
+# Longest a note may sound before the stream ends it
+MAX_HOLD_SECONDS = 60.0
+
+
+def iter_track_note_events(track):
+    """Yield (abs_tick, is_note_on, note) for the note events of one track"""
+    current_abs_tick = 0
+    for msg in track:
+        current_abs_tick += msg.time
+
+        if msg.type == 'note_on' and msg.velocity > 0:
+            yield current_abs_tick, True, msg.note
+        elif msg.type == 'note_off' or msg.type == 'note_on':
+            yield current_abs_tick, False, msg.note
+
+
+def iter_chunk_note_events(data, start, end, block_bytes=READ_BLOCK_BYTES):
+    """Yield (abs_tick, is_note_on, note) for the note events of the MTrk chunk data in data[start:end]"""
+    for _, block in smf_reader.iter_track_blocks(data, start, end, block_bytes):
+        yield from zip(block.ticks.tolist(), block.is_on.tolist(), block.notes.tolist())
+
+
+def scan_tempo_changes(data, start, end, block_bytes=READ_BLOCK_BYTES):
+    """The (tick, tempo) changes of one MTrk chunk, walking it without keeping its notes"""
+    return [change for _, block in smf_reader.iter_track_blocks(data, start, end, block_bytes)
+            for change in block.tempo_changes]
+
+
+def merge_note_events(streams):
+    """Merge per-track note event streams in tick order
+
+    heapq.merge is stable across its inputs, so ties keep track order exactly
+    like the merge in midi_core.LoadedSong.timeline.
+    """
+    return heapq.merge(*streams, key=lambda e: e[0])
+
+
+def iter_note_events(mid, selected_tracks):
+    """Merge the note events of the selected tracks of a mido.MidiFile in tick order"""
+    return merge_note_events([iter_track_note_events(track) for i, track in enumerate(mid.tracks)
+                              if i in selected_tracks])
+
+
+def iter_timed_events(note_events, tempo_map, shift_amount=0, block_size=BLOCK_VALUES):
+    """Yield (seconds, is_note_on, note) converting ticks block by block"""
+    block = []
+    for event in note_events:
+        block.append(event)
+        if len(block) == block_size:
+            yield from _time_block(block, tempo_map, shift_amount)
+            block = []
+    if block:
+        yield from _time_block(block, tempo_map, shift_amount)
+
+
+def _time_block(block, tempo_map, shift_amount):
+    ticks = np.fromiter((e[0] for e in block), dtype=np.int64, count=len(block))
+    notes = np.fromiter((e[2] for e in block), dtype=np.int64, count=len(block))
+    seconds = tempo_map.ticks_to_seconds(ticks).tolist()
+    notes = np.clip(notes + shift_amount, 36, 100).tolist()
+    return zip(seconds, (e[1] for e in block), notes)
+
+
+def iter_paired_notes(timed_events, max_hold_seconds=MAX_HOLD_SECONDS, on_truncate=None):
+    """Pair note on/off events and yield (start, end, note) ordered by start time
+
+    A finished note is held back only while an earlier-starting note is still
+    sounding; ties keep completion order, matching the stable sort of the
+    in-memory converter. A note sounding for more than max_hold_seconds is
+    ended there and on_truncate(start, note) is called, so at most the notes
+    started in that window are held back; None waits for every note to finish.
+    """
+    if max_hold_seconds is None:
+        max_hold_seconds = float('inf')
+    active = {}
+    active_starts = []  # lazy heap of (start, note) for the sounding notes
+    finished = []  # heap of (start, completion order, end, note)
+    order = 0
+    last_time = 0.0
+
+    for event_time, is_note_on, note in timed_events:
+        last_time = event_time
+
+        # End the notes that have sounded too long by now
+        while active_starts and active_starts[0][0] + max_hold_seconds < event_time:
+            start, held_note = heapq.heappop(active_starts)
+            if active.get(held_note) == start:
+                del active[held_note]
+                heapq.heappush(finished, (start, order, start + max_hold_seconds, held_note))
+                order += 1
+                if on_truncate is not None:
+                    on_truncate(start, held_note)
+
+        if is_note_on:
+            if note in active:
+                heapq.heappush(finished, (active[note], order, event_time, note))
+                order += 1
+            active[note] = event_time
+            heapq.heappush(active_starts, (event_time, note))
+        elif note in active:
+            heapq.heappush(finished, (active.pop(note), order, event_time, note))
+            order += 1
+
+        while active_starts and active.get(active_starts[0][1]) != active_starts[0][0]:
+            heapq.heappop(active_starts)
+        earliest_active = active_starts[0][0] if active_starts else float('inf')
+
+        while finished and finished[0][0] <= earliest_active:
+            start, _, end, note = heapq.heappop(finished)
+            yield start, end, note
+
+    # Notes still sounding at the end last until the final event
+    for note, start in active.items():
+        heapq.heappush(finished, (start, order, last_time, note))
+        order += 1
+    while finished:
+        start, _, end, note = heapq.heappop(finished)
+        yield start, end, note
+
+
+def iter_keyboard_events(paired_notes):
+    """Yield (kind, key, duration_ms, gap_ms) tuples with rests between notes"""
+    last_start = None
+    for start, end, note in paired_notes:
+        if last_start is None:
+            if start > 0:
+                yield midi_core.EVENT_REST, 0, 0, int(start * 1000)
+        elif start > last_start:
+            gap_ms = int((start - last_start) * 1000)
+            if gap_ms > 0:
+                yield midi_core.EVENT_REST, 0, 0, gap_ms
+
+        yield midi_core.EVENT_NOTE, note - 35, int((end - start) * 1000), 0
+        last_start = start
+
+    # End-of-sheet markers ("0.1")
+    for _ in range(2):
+        yield midi_core.EVENT_NOTE, 0, 1, 0
+
+
+def iter_event_blocks(keyboard_events, block_size=BLOCK_VALUES):
+    """Group keyboard event tuples into EVENT_DTYPE arrays of block_size events"""
+    block = []
+    for event in keyboard_events:
+        block.append(event)
+        if len(block) == block_size:
+            yield np.array(block, dtype=midi_core.EVENT_DTYPE)
+            block = []
+    if block:
+        yield np.array(block, dtype=midi_core.EVENT_DTYPE)
+
+
+def iter_compressed_strings(event_blocks, encoding=midi_core.ENCODING_FIXED):
+    """Encode event blocks into Custom String chunks"""
+    if encoding == midi_core.ENCODING_COMPACT:
+        # Compact codes vary in length, so chunks are packed across block boundaries
+        yield from midi_core.iter_packed_chunks(midi_core.compact_codes(midi_core.events_to_values(block))
+                                                for block in event_blocks)
+        return
+    if encoding == midi_core.ENCODING_LZ:
+        yield from midi_core.iter_packed_chunks(_iter_lz_codes(event_blocks))
+        return
+
+    for block in event_blocks:
+        yield from midi_core.encode_values(midi_core.events_to_values(block), encoding)
+
+
+def _iter_lz_codes(event_blocks):
+    # Back-references may point into earlier blocks, up to LZ_WINDOW values back
+    history = np.zeros(0, dtype=np.int64)
+    for block in event_blocks:
+        values = midi_core.events_to_values(block)
+        yield midi_core.lz_codes(values, history)
+        history = np.concatenate((history, values))[-midi_core.LZ_WINDOW:]
+
+
+class _BlockStats:
+    """Pass-through over event blocks that counts events and optionally writes the raw text"""
+
+    def __init__(self, event_blocks, raw_fp=None):
+        self.event_blocks = event_blocks
+        self.raw_fp = raw_fp
+        self.num_events = 0
+        self.num_notes = 0
+
+    def __iter__(self):
+        for block in self.event_blocks:
+            if self.raw_fp is not None:
+                lines = "\n".join(midi_core.format_events(block))
+                self.raw_fp.write(lines if self.num_events == 0 else "\n" + lines)
+            self.num_events += len(block)
+            self.num_notes += midi_core.count_events(block)[0]
+            yield block
+
+
+class _CountingStrings:
+    """Pass-through over compressed strings that counts them"""
+
+    def __init__(self, strings):
+        self.strings = strings
+        self.count = 0
+
+    def __iter__(self):
+        for s in self.strings:
+            self.count += 1
+            yield s
+
+
+def stream_convert_file(filepath, workshop_path, raw_path=None, shift_amount=0, selected_tracks=None,
+                        subroutine_id=midi_core.DEFAULT_SUBROUTINE_ID, encoding=midi_core.ENCODING_FIXED,
+                        chords=False, max_hold_seconds=MAX_HOLD_SECONDS):
+    """Convert one file with the streaming pipeline, writing straight to workshop_path
+
+    Returns the same statistics as midi_core.convert_file, without the data,
+    plus num_truncated, the number of notes ended at max_hold_seconds.
+    """
+    try:
+        with smf_reader.mapped(filepath) as data:
+            ticks_per_beat, chunks = smf_reader.track_chunks(data)
+            # The first pass collects the tempo map and checks every chunk
+            # before any output is written
+            track_tempo_changes = [scan_tempo_changes(data, start, end) for start, end in chunks]
+
+            if not selected_tracks:
+                selected_tracks = range(len(chunks))
+            selected_tracks = set(selected_tracks)
+            note_events = merge_note_events([iter_chunk_note_events(data, start, end)
+                                             for i, (start, end) in enumerate(chunks) if i in selected_tracks])
+            tempo_map = midi_core.TempoMap(ticks_per_beat, [change for changes in track_tempo_changes
+                                                            for change in changes])
+            bpm = midi_core.bpm_from_tempo_changes(track_tempo_changes)
+            return _write_stream(filepath, note_events, tempo_map, bpm, workshop_path, raw_path, shift_amount,
+                                 subroutine_id, encoding, chords, max_hold_seconds)
+    except smf_reader.SMFError as e:
+        logging.warning(f"Fast MIDI reader failed ({e}), falling back to mido")
+
+    import mido
+    mid = mido.MidiFile(filepath)
+    if not selected_tracks:
+        selected_tracks = range(len(mid.tracks))
+    return _write_stream(filepath, iter_note_events(mid, set(selected_tracks)), midi_core.TempoMap.from_midi(mid),
+                         midi_core.get_bpm_from_midi(mid), workshop_path, raw_path, shift_amount, subroutine_id,
+                         encoding, chords, max_hold_seconds)
+
+
+def _write_stream(filepath, note_events, tempo_map, bpm, workshop_path, raw_path, shift_amount, subroutine_id,
+                  encoding, chords, max_hold_seconds):
+    rule_name = os.path.splitext(os.path.basename(filepath))[0]
+
+    truncated = []
+
+    raw_fp = open(raw_path, 'w', encoding='utf-8') if raw_path else None
+    try:
+        timed_events = iter_timed_events(note_events, tempo_map, shift_amount)
+        keyboard_events = iter_keyboard_events(iter_paired_notes(timed_events, max_hold_seconds,
+                                                                 lambda start, note: truncated.append(start)))
+        if chords:
+            keyboard_events = midi_core.iter_chord_events(keyboard_events)
+        blocks = _BlockStats(iter_event_blocks(keyboard_events), raw_fp)
+        strings = _CountingStrings(iter_compressed_strings(blocks, encoding))
+
+        midi_core.save_workshop_code(workshop_path, strings, rule_name, subroutine_id, bpm, encoding)
+    finally:
+        if raw_fp is not None:
+            raw_fp.close()
+
+    if truncated:
+        logging.warning(f"{rule_name}: {len(truncated)} notes sounded longer than {max_hold_seconds:g} s "
+                        f"and were ended there (first at {truncated[0]:.2f} s)")
+
+    return {
+        'bpm': bpm,
+        'num_events': blocks.num_events,
+        'num_notes': blocks.num_notes,
+        'num_strings': strings.count,
+        'num_truncated': len(truncated),
+    }
@@ -0,0 +1,228 @@
+"""Fast Standard MIDI File reader for the note and tempo events the converter uses.
+
+mido builds a Message object for every event in the file, including
+controllers, pitch bends and sysex. This reader memory-maps the file, walks
+the chunks and variable-length quantities directly (with running status) and
+appends only note_on/note_off and set_tempo events to compact columns, which
+become midi_core.TrackColumns. A track can also be walked in blocks of a few
+thousand note events, so a file can be streamed without holding its columns.
+"""
+import mmap
+import os
+import struct
+from array import array
+from contextlib import contextmanager
+
+import numpy as np
+
+import midi_core
+
+# Data bytes following a channel or system common status byte
+_DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+_SYSTEM_DATA_LENGTHS = {0xF1: 1, 0xF2: 2, 0xF3: 1}
+
+META_TRACK_NAME = 0x03
+META_SET_TEMPO = 0x51
+
+
+class SMFError(ValueError):
+    """The file is not a Standard MIDI File this reader can parse"""
+
+
+def _columns(name, ticks, notes, velocities, is_on, end_tick, tempo_changes):
+    return midi_core.TrackColumns(name or '',
+                                  np.frombuffer(ticks, dtype=np.int64),
+                                  np.frombuffer(bytes(notes), dtype=np.uint8),
+                                  np.frombuffer(bytes(velocities), dtype=np.uint8),
+                                  np.frombuffer(bytes(is_on), dtype=bool),
+                                  end_tick,
+                                  tempo_changes)
+
+
+def iter_track_blocks(data, pos, end, block_bytes=None):
+    """Walk the MTrk chunk data in data[pos:end], yielding (bytes_walked, TrackColumns) blocks
+
+    Each block holds the note events and tempo changes of about block_bytes of
+    chunk data (the whole chunk when block_bytes is None, giving exactly one
+    block). A block's name is the first track name seen so far and its
+    end_tick the tick reached so far, so the last block carries the track's
+    end tick.
+    """
+    try:
+        yield from _walk_track(data, pos, end, block_bytes or end - pos)
+    except (IndexError, KeyError) as e:
+        raise SMFError(f"malformed track chunk at byte {pos}: {e!r}") from e
+
+
+def _walk_track(data, pos, end, block_bytes):
+    start = pos
+    ticks = array('q')
+    notes = bytearray()
+    velocities = bytearray()
+    is_on = bytearray()
+    tempo_changes = []
+    name = None
+
+    tick = 0
+    last_status = None
+
+    block_end = min(pos + block_bytes, end)
+    while True:
+        if pos >= block_end:
+            if pos >= end:
+                break
+            yield pos - start, _columns(name, ticks, notes, velocities, is_on, tick, tempo_changes)
+            ticks = array('q')
+            notes = bytearray()
+            velocities = bytearray()
+            is_on = bytearray()
+            tempo_changes = []
+            block_end = min(pos + block_bytes, end)
+
+        # Delta time (variable-length quantity)
+        byte = data[pos]
+        pos += 1
+        delta = byte & 0x7F
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            delta = (delta << 7) | (byte & 0x7F)
+        tick += delta
+
+        status = data[pos]
+        if status < 0x80:
+            # Running status: this byte is already the first data byte
+            if last_status is None:
+                raise SMFError("running status without last_status")
+            status = last_status
+        else:
+            pos += 1
+            if status != 0xFF:
+                # Meta events don't set running status
+                last_status = status
+
+        kind = status & 0xF0
+        if kind == 0x90 or kind == 0x80:
+            note = data[pos]
+            velocity = data[pos + 1]
+            pos += 2
+            ticks.append(tick)
+            notes.append(note)
+            velocities.append(velocity)
+            is_on.append(kind == 0x90 and velocity > 0)
+        elif kind < 0xF0:
+            pos += _DATA_LENGTHS[kind]
+        elif status == 0xFF:
+            meta_type = data[pos]
+            pos += 1
+            byte = data[pos]
+            pos += 1
+            length = byte & 0x7F
+            while byte & 0x80:
+                byte = data[pos]
+                pos += 1
+                length = (length << 7) | (byte & 0x7F)
+
+            if meta_type == META_SET_TEMPO and length >= 3:
+                tempo_changes.append((tick, (data[pos] << 16) | (data[pos + 1] << 8) | data[pos + 2]))
+            elif meta_type == META_TRACK_NAME and name is None:
+                name = bytes(data[pos:pos + length]).decode('latin1')
+            pos += length
+        elif status == 0xF0 or status == 0xF7:
+            byte = data[pos]
+            pos += 1
+            length = byte & 0x7F
+            while byte & 0x80:
+                byte = data[pos]
+                pos += 1
+                length = (length << 7) | (byte & 0x7F)
+            pos += length
+        else:
+            pos += _SYSTEM_DATA_LENGTHS.get(status, 0)
+
+    if pos > end:
+        raise SMFError("event runs past the end of its track chunk")
+
+    yield pos - start, _columns(name, ticks, notes, velocities, is_on, tick, tempo_changes)
+
+
+def join_blocks(blocks):
+    """Join the TrackColumns blocks of one track into the columns of the whole track"""
+    if len(blocks) == 1:
+        return blocks[0]
+    last = blocks[-1]
+    return midi_core.TrackColumns(last.name,
+                                  np.concatenate([b.ticks for b in blocks]),
+                                  np.concatenate([b.notes for b in blocks]),
+                                  np.concatenate([b.velocities for b in blocks]),
+                                  np.concatenate([b.is_on for b in blocks]),
+                                  last.end_tick,
+                                  [change for b in blocks for change in b.tempo_changes])
+
+
+@contextmanager
+def mapped(path):
+    """Memory-map a MIDI file for reading"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise SMFError("empty file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def track_chunks(data):
+    """Return (ticks_per_beat, [(start, end), ...]) locating the MTrk chunk data of each track"""
+    size = len(data)
+    if size < 14 or data[0:4] != b'MThd':
+        raise SMFError("MThd not found. Probably not a MIDI file")
+
+    header_length = struct.unpack('>L', data[4:8])[0]
+    _, num_tracks, ticks_per_beat = struct.unpack('>hhh', data[8:14])
+
+    chunks = []
+    pos = 8 + header_length
+    while len(chunks) < num_tracks and pos + 8 <= size:
+        chunk_name = data[pos:pos + 4]
+        chunk_length = struct.unpack('>L', data[pos + 4:pos + 8])[0]
+        pos += 8
+        if pos + chunk_length > size:
+            raise SMFError("truncated chunk")
+        if chunk_name == b'MTrk':
+            chunks.append((pos, pos + chunk_length))
+        pos += chunk_length
+
+    if len(chunks) < num_tracks:
+        raise SMFError(f"expected {num_tracks} tracks, found {len(chunks)}")
+
+    return ticks_per_beat, chunks
+
+
+def read_smf(path, progress=None):
+    """Read a MIDI file into (ticks_per_beat, [TrackColumns, ...])
+
+    progress(bytes_read, total_bytes, tracks_read, num_tracks) is called every
+    midi_core.LOAD_PROGRESS_BYTES within a track chunk and at its end; an
+    exception it raises aborts the read.
+    """
+    with mapped(path) as data:
+        return _read_chunks(data, progress)
+
+
+def _read_chunks(data, progress=None):
+    ticks_per_beat, chunks = track_chunks(data)
+    tracks = []
+    block_bytes = midi_core.LOAD_PROGRESS_BYTES if progress is not None else None
+    for start, end in chunks:
+        blocks = []
+        for walked, block in iter_track_blocks(data, start, end, block_bytes):
+            blocks.append(block)
+            if progress is not None:
+                progress(start + walked, len(data), len(tracks) + (start + walked == end), len(chunks))
+        tracks.append(join_blocks(blocks))
+    return ticks_per_beat, tracks
+
+
+def load_song(path, progress=None):
+    """Read a MIDI file into a midi_core.LoadedSong without building mido messages"""
+    ticks_per_beat, tracks = read_smf(path, progress)
+    return midi_core.LoadedSong(ticks_per_beat, tracks, path)
@@ -0,0 +1,188 @@
+"""Sheet encodings must decode back to exactly the values that were encoded"""
+import numpy as np
+import pytest
+
+import midi_core
+import midi_stream
+
+ENCODINGS = (midi_core.ENCODING_FIXED, midi_core.ENCODING_COMPACT, midi_core.ENCODING_LZ)
+
+
+def rest(gap_ms):
+    """The scaled value of a rest of gap_ms"""
+    return midi_core.SCALE_OFFSET - gap_ms * 100
+
+
+def note(key, digits=50):
+    """The scaled value of a note "key.digits" """
+    return key * 100 + digits
+
+
+def assert_round_trip(values, encoding):
+    values = np.asarray(values, dtype=np.int64)
+    strings = midi_core.encode_values(values, encoding)
+    assert all(len(s) <= midi_core.STRING_CHUNK_CHARS for s in strings)
+    np.testing.assert_array_equal(midi_core.decode_values(strings, len(values), encoding), values)
+    return strings
+
+
+def assert_chunks_end_on_codes(text, ends):
+    """Chunks produced by iter_packed_chunks never split a code"""
+    chunks = list(midi_core.iter_packed_chunks([(text, ends)]))
+    assert ''.join(chunks) == text
+    boundaries = np.cumsum([len(chunk) for chunk in chunks])
+    assert set(boundaries.tolist()) <= set(np.asarray(ends).tolist())
+    return chunks
+
+
+EDGE_VALUES = [
+    0, 1, 127, 128, 16383, 16384,
+    midi_core.COMPACT_NOTE_LIMIT - 1, midi_core.COMPACT_NOTE_LIMIT,
+    midi_core.CHORD_BASE + 1, midi_core.CHORD_BASE + (1 << midi_core.CHORD_SPAN) - 1,
+    midi_core.SCALE_OFFSET // 2 - 1, midi_core.SCALE_OFFSET // 2, midi_core.SCALE_OFFSET - 1,
+    rest(1), rest(midi_core.COMPACT_REST_LIMIT - 1), rest(midi_core.COMPACT_REST_LIMIT),
+    rest(midi_core.COMPACT_REST_LIMIT) - 1,  # not a whole number of ms
+]
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_edge_values(encoding):
+    assert_round_trip(EDGE_VALUES, encoding)
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_empty(encoding):
+    assert midi_core.encode_values(np.zeros(0, dtype=np.int64), encoding) == []
+    assert midi_core.decode_values([], 0, encoding).size == 0
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_random_values(encoding):
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, midi_core.SCALE_OFFSET, 5000)
+    assert_round_trip(values, encoding)
+
+
+def test_compact_code_lengths():
+    # 8063 ms rests and 8191 note values still fit two digits; one more needs the escape
+    values = [rest(8063), rest(8064), note(81, 91), note(81, 92), rest(100) + 1]
+    _, ends = midi_core.compact_codes(values)
+    assert np.diff(ends, prepend=0).tolist() == [2, 4, 2, 4, 4]
+
+
+def test_fixed_chunks_hold_whole_values():
+    strings = assert_round_trip(np.arange(100), midi_core.ENCODING_FIXED)
+    assert [len(s) for s in strings] == [126, 126, 48]
+
+
+@pytest.mark.parametrize('prefix', range(0, 70))
+def test_compact_escape_at_chunk_boundary(prefix):
+    # prefix two-digit codes move the four-digit escapes across every chunk offset
+    values = [note(40)] * prefix + [rest(9000), note(90, 99), rest(8064)] * 3
+    strings = assert_round_trip(values, midi_core.ENCODING_COMPACT)
+    assert_chunks_end_on_codes(*midi_core.compact_codes(values))
+
+    # Each chunk decodes on its own, so no code continues into the next chunk
+    decoded = [midi_core.decode_compact_values([s], len(values)) for s in strings]
+    np.testing.assert_array_equal(np.concatenate(decoded), values)
+
+
+def test_events_round_trip_through_every_encoding():
+    events = np.zeros(6, dtype=midi_core.EVENT_DTYPE)
+    events['kind'] = [midi_core.EVENT_REST, midi_core.EVENT_NOTE, midi_core.EVENT_REST, midi_core.EVENT_NOTE,
+                      midi_core.EVENT_NOTE, midi_core.EVENT_NOTE]
+    events['gap_ms'] = [8063, 0, 8064, 0, 0, 0]
+    events['key'] = [0, 1, 0, 65, 0, 0]
+    events['duration_ms'] = [0, 250, 0, 1999, 1, 1]
+    values = midi_core.events_to_values(events)
+    expected = midi_core.values_to_events(values)
+    for encoding in ENCODINGS:
+        strings = midi_core.encode_values(values, encoding)
+        np.testing.assert_array_equal(midi_core.decode_events(strings, len(events), encoding), expected)
+
+
+@pytest.mark.parametrize('encoding', (midi_core.ENCODING_FIXED, midi_core.ENCODING_COMPACT))
+def test_streamed_blocks_match_one_shot(encoding):
+    rng = np.random.default_rng(1)
+    events = np.zeros(3000, dtype=midi_core.EVENT_DTYPE)
+    events['kind'] = rng.integers(0, 2, events.size)
+    events['key'] = rng.integers(1, 66, events.size)
+    events['duration_ms'] = rng.integers(1, 3000, events.size)
+    events['gap_ms'] = rng.integers(1, 12000, events.size)
+    if encoding == midi_core.ENCODING_FIXED:
+        # The fixed encoding packs each block on its own, so blocks hold whole chunks of 42 values
+        values_per_chunk = midi_core.STRING_CHUNK_CHARS // midi_core.CHARS_PER_VALUE
+        blocks = np.split(events, [values_per_chunk, 12 * values_per_chunk, 30 * values_per_chunk])
+    else:
+        blocks = np.split(events, [7, 500, 1234, 2999])
+    streamed = list(midi_stream.iter_compressed_strings(iter(blocks), encoding))
+    assert streamed == midi_core.encode_values(midi_core.events_to_values(events), encoding)
+
+
+def test_streamed_lz_blocks_decode():
+    # Matches are cut at block boundaries, so only the decoded values must agree with the one-shot encode
+    rng = np.random.default_rng(2)
+    phrase = np.zeros(40, dtype=midi_core.EVENT_DTYPE)
+    phrase['kind'] = rng.integers(0, 2, phrase.size)
+    phrase['key'] = rng.integers(1, 66, phrase.size)
+    phrase['duration_ms'] = rng.integers(1, 3000, phrase.size)
+    phrase['gap_ms'] = rng.integers(1, 9000, phrase.size)
+    events = np.tile(phrase, 50)
+    blocks = np.split(events, [7, 500, 1234, 1999])
+    streamed = list(midi_stream.iter_compressed_strings(iter(blocks), midi_core.ENCODING_LZ))
+    assert all(len(s) <= midi_core.STRING_CHUNK_CHARS for s in streamed)
+    values = midi_core.events_to_values(events)
+    np.testing.assert_array_equal(midi_core.decode_values(streamed, len(values), midi_core.ENCODING_LZ), values)
+
+
+def test_lz_rest_limit():
+    # Rests keep first digits below the back-reference digit, so LZ escapes from 7936 ms
+    values = [rest(midi_core.LZ_REST_LIMIT - 1), rest(midi_core.LZ_REST_LIMIT), rest(8063)]
+    _, ends = midi_core.lz_codes(values)
+    assert np.diff(ends, prepend=0).tolist() == [2, 4, 4]
+    assert_round_trip(values, midi_core.ENCODING_LZ)
+
+
+def test_lz_overlapping_reference():
+    values = [note(40), rest(125)] * 200
+    assert midi_core.lz_matches(values) == [(2, 398, 2)]  # the reference overlaps the values it copies
+    strings = assert_round_trip(values, midi_core.ENCODING_LZ)
+    assert len(''.join(strings)) == 4 + midi_core.LZ_TOKEN_CHARS
+
+
+def test_lz_match_longer_than_one_reference():
+    values = [note(40), note(41), note(42)] * 10000
+    matches = midi_core.lz_matches(values)
+    assert len(matches) > 1
+    assert max(length for _, length, _ in matches) == midi_core.LZ_MAX_MATCH
+    assert_round_trip(values, midi_core.ENCODING_LZ)
+
+
+def test_lz_reference_at_window_limit():
+    pattern = [note(60, 11), note(61, 22), note(62, 33), note(63, 44)]
+    filler = [note(1 + i % 60, i // 60 % 100) for i in range(midi_core.LZ_WINDOW - len(pattern))]
+    values = pattern + filler + pattern + [rest(7)] + pattern
+    matches = midi_core.lz_matches(values)
+    assert any(distance == midi_core.LZ_WINDOW for _, _, distance in matches)
+    assert_round_trip(values, midi_core.ENCODING_LZ)
+
+
+@pytest.mark.parametrize('prefix', range(0, 70))
+def test_lz_reference_and_escape_at_chunk_boundary(prefix):
+    # Distinct two-digit codes move the six-digit reference and the escapes across every chunk offset
+    pattern = [note(70, 1), note(71, 2), note(72, 3), rest(9000), note(73, 4), rest(30)]
+    values = [note(1 + i % 60, i // 60) for i in range(prefix)] + pattern * 3 + [rest(8000)] + pattern
+    assert midi_core.lz_matches(values)
+    assert_round_trip(values, midi_core.ENCODING_LZ)
+    assert_chunks_end_on_codes(*midi_core.lz_codes(values))
+
+
+def test_lz_references_into_earlier_blocks():
+    pattern = [note(50, 5), rest(250), note(52, 7), rest(250), note(55, 9)]
+    history = np.array(pattern * 3)
+    values = np.array(pattern * 2 + [rest(12)])
+    text, _ = midi_core.lz_codes(values, history)
+    # The whole repeat is one reference back into the history
+    assert len(text) == midi_core.LZ_TOKEN_CHARS + 2
+    decoded = midi_core.decode_lz_values([midi_core.lz_codes(history)[0] + text], len(history) + len(values))
+    np.testing.assert_array_equal(decoded, np.concatenate((history, values)))
@@ -0,0 +1,72 @@
+"""The streaming pipeline must write the same workshop code as midi_core.convert_file"""
+import random
+
+import mido
+import pytest
+
+import midi_core
+import midi_stream
+
+
+def write_song(path, num_tracks=3, notes_per_track=300, seed=0):
+    """A multi-track file with tempo changes, overlapping and retriggered notes"""
+    rng = random.Random(seed)
+    mid = mido.MidiFile(ticks_per_beat=480)
+    for t in range(num_tracks):
+        events = []
+        if t == 0:
+            events += [(0, mido.MetaMessage('set_tempo', tempo=500000)),
+                       (2000, mido.MetaMessage('set_tempo', tempo=400000)),
+                       (9000, mido.MetaMessage('set_tempo', tempo=650000))]
+        for _ in range(notes_per_track):
+            start = rng.randrange(20000)
+            note = rng.randrange(30, 106)
+            events.append((start, mido.Message('note_on', note=note, velocity=rng.randrange(1, 128))))
+            events.append((start + rng.choice([0, 1, 60, 240, 960]), mido.Message('note_off', note=note)))
+        events.sort(key=lambda e: e[0])
+
+        track = mido.MidiTrack()
+        tick = 0
+        for abs_tick, msg in events:
+            track.append(msg.copy(time=abs_tick - tick))
+            tick = abs_tick
+        mid.tracks.append(track)
+    mid.save(str(path))
+    return str(path)
+
+
+@pytest.mark.parametrize('encoding', [midi_core.ENCODING_FIXED, midi_core.ENCODING_COMPACT])
+@pytest.mark.parametrize('chords', [False, True])
+@pytest.mark.parametrize('shift_amount, selected_tracks', [(0, None), (-12, [0, 2]), (30, [1])])
+def test_stream_matches_convert_file(tmp_path, encoding, chords, shift_amount, selected_tracks):
+    path = write_song(tmp_path / 'song.mid')
+    workshop_path = tmp_path / 'song_workshop.txt'
+
+    expected = midi_core.convert_file(path, shift_amount=shift_amount, selected_tracks=selected_tracks,
+                                      encoding=encoding, chords=chords)
+    stats = midi_stream.stream_convert_file(path, str(workshop_path), shift_amount=shift_amount,
+                                            selected_tracks=selected_tracks, encoding=encoding, chords=chords)
+
+    assert workshop_path.read_text(encoding='utf-8') == expected['workshop_code']
+    assert stats['num_events'] == expected['num_events']
+    assert stats['num_strings'] == len(expected['compressed_strings'])
+    assert stats['num_truncated'] == 0
+
+
+def test_long_notes_are_ended_at_max_hold(tmp_path):
+    mid = mido.MidiFile(ticks_per_beat=480)
+    # A drone without a note off under 20 s of short notes
+    track = mido.MidiTrack([mido.Message('note_on', note=48, velocity=100, time=0)])
+    for _ in range(40):
+        track.append(mido.Message('note_on', note=72, velocity=100, time=240))
+        track.append(mido.Message('note_off', note=72, time=240))
+    mid.tracks.append(track)
+    path = str(tmp_path / 'drone.mid')
+    mid.save(path)
+
+    stats = midi_stream.stream_convert_file(path, str(tmp_path / 'out.txt'), max_hold_seconds=5)
+    assert stats['num_truncated'] == 1
+
+    stats = midi_stream.stream_convert_file(path, str(tmp_path / 'out.txt'), max_hold_seconds=None)
+    assert stats['num_truncated'] == 0
+    assert (tmp_path / 'out.txt').read_text(encoding='utf-8') == midi_core.convert_file(path)['workshop_code']
@@ -0,0 +1,109 @@
+"""pair_notes must pair and order notes like a plain per-key walk over the timeline"""
+import random
+
+import numpy as np
+import pytest
+
+import midi_core
+
+
+def timeline(events):
+    """A single-track Timeline from (tick, note, is_on) events in order, one tick per ms"""
+    ticks = np.array([e[0] for e in events], dtype=np.int64)
+    return midi_core.Timeline(ticks,
+                              ticks / 1000,
+                              np.array([e[1] for e in events], dtype=np.uint8),
+                              np.full(len(events), 100, dtype=np.uint8),
+                              np.array([e[2] for e in events], dtype=bool),
+                              np.zeros(len(events), dtype=np.int64))
+
+
+def reference_pairing(tl, shift_amount):
+    """Pair notes one event at a time
+
+    Every event of a (shifted, clamped) key ends the note sounding on it.
+    Notes sort by start, then by the event that ended them; notes still
+    sounding at the end last until the final event and sort after the others
+    that start with them, by the first note on of their key's last run of
+    retriggers.
+    """
+    keys = np.clip(tl.notes.astype(np.int64) + shift_amount, 36, 100).tolist()
+    seconds = tl.seconds.tolist()
+    active = {}  # key -> start
+    run_first = {}  # key -> first note on of the current run of note ons
+    last_on = {}  # key -> whether its last event was a note on
+    notes = []
+    for i, (time, key, is_on) in enumerate(zip(seconds, keys, tl.is_on.tolist())):
+        if key in active:
+            start = active.pop(key)
+            notes.append(((start, 0, i), start, time, key))
+        if is_on:
+            if not last_on.get(key):
+                run_first[key] = i
+            active[key] = time
+        last_on[key] = is_on
+
+    end = max(seconds, default=0.0)
+    for key, start in active.items():
+        notes.append(((start, 1, run_first[key]), start, end, key))
+    notes.sort()
+    return ([n[1] for n in notes], [n[2] for n in notes], [n[3] for n in notes])
+
+
+def assert_matches_reference(tl, shift_amount=0):
+    starts, ends, notes = midi_core.pair_notes(tl, shift_amount)
+    expected_starts, expected_ends, expected_notes = reference_pairing(tl, shift_amount)
+    assert starts.tolist() == expected_starts
+    assert ends.tolist() == expected_ends
+    assert notes.tolist() == expected_notes
+
+
+def test_same_tick_on_off_ties():
+    assert_matches_reference(timeline([
+        (0, 60, True), (0, 64, True), (0, 60, False),  # zero-length note before a longer one
+        (0, 67, True), (10, 67, False), (10, 64, False),
+        (10, 60, True), (10, 62, True), (10, 62, False), (10, 60, False),
+        (20, 62, False), (20, 62, True), (30, 62, False),  # note off of a silent key on the same tick
+    ]))
+
+
+def test_retrigger_before_note_off():
+    assert_matches_reference(timeline([
+        (0, 60, True), (10, 60, True), (20, 60, False), (30, 60, False),
+        (40, 72, True), (50, 72, True), (50, 72, True), (60, 72, False),
+    ]))
+
+
+def test_retriggered_notes_still_sounding_at_the_end():
+    assert_matches_reference(timeline([
+        (0, 60, True), (0, 64, True), (5, 64, False), (5, 64, True), (5, 60, True),
+        (8, 64, True), (10, 70, True), (10, 70, False), (20, 72, True),
+    ]))
+
+
+@pytest.mark.parametrize('shift_amount', [0, -12, 12])
+def test_clamp_collisions(shift_amount):
+    # Below 36 and above 100 (after the shift) several keys land on the same clamped key
+    events = [
+        (0, 30, True), (0, 110, True), (5, 34, True), (5, 101, True),
+        (10, 30, False), (10, 101, False), (15, 34, False), (15, 36, True),
+        (20, 110, False), (25, 36, False), (30, 100, True),
+    ]
+    assert_matches_reference(timeline([(tick, note - shift_amount, is_on) for tick, note, is_on in events]),
+                             shift_amount)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_timelines(seed):
+    rng = random.Random(seed)
+    events = []
+    for tick in sorted(rng.randrange(200) for _ in range(300)):
+        # Few keys, clustered at both clamp edges, so ties and collisions are common
+        note = rng.choice([30, 33, 36, 37, 60, 61, 99, 100, 104, 120])
+        events.append((tick, note, rng.random() < 0.55))
+    assert_matches_reference(timeline(events), rng.choice([0, -7, 5, 20]))
+
+
+def test_empty_timeline():
+    starts, ends, notes = midi_core.pair_notes(timeline([]), 0)
+    assert len(starts) == len(ends) == len(notes) == 0
@@ -0,0 +1,149 @@
+"""smf_reader must extract the same columns as TrackColumns.from_track on mido tracks"""
+import struct
+
+import mido
+import numpy as np
+import pytest
+
+import midi_core
+import smf_reader
+
+
+def vlq(value):
+    """MIDI variable-length quantity"""
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def track(*events):
+    """MTrk chunk data from (delta, event bytes) pairs, without the end-of-track event"""
+    return b''.join(vlq(delta) + bytes(data) for delta, data in events) + b'\x00\xff\x2f\x00'
+
+
+def smf(*tracks, ticks_per_beat=480, num_tracks=None):
+    """A Standard MIDI File from MTrk chunk data"""
+    header = b'MThd' + struct.pack('>Lhhh', 6, 1, len(tracks) if num_tracks is None else num_tracks, ticks_per_beat)
+    return header + b''.join(b'MTrk' + struct.pack('>L', len(data)) + data for data in tracks)
+
+
+def write(tmp_path, data, name='song.mid'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def assert_same_columns(path):
+    ticks_per_beat, tracks = smf_reader.read_smf(path)
+    mid = mido.MidiFile(path)
+    assert ticks_per_beat == mid.ticks_per_beat
+    assert len(tracks) == len(mid.tracks)
+    for ours, theirs in zip(tracks, (midi_core.TrackColumns.from_track(t) for t in mid.tracks)):
+        assert ours.name == theirs.name
+        np.testing.assert_array_equal(ours.ticks, theirs.ticks)
+        np.testing.assert_array_equal(ours.notes, theirs.notes)
+        np.testing.assert_array_equal(ours.velocities, theirs.velocities)
+        np.testing.assert_array_equal(ours.is_on, theirs.is_on)
+        assert ours.end_tick == theirs.end_tick
+        assert ours.tempo_changes == theirs.tempo_changes
+    return tracks
+
+
+def test_running_status_and_non_note_events(tmp_path):
+    conductor = track(
+        (0, [0xFF, 0x03, 5, *b'Tempo']),
+        (0, [0xFF, 0x51, 3, 0x07, 0xA1, 0x20]),
+        (960, [0xFF, 0x51, 3, 0x05, 0x16, 0x15]),
+    )
+    notes = track(
+        (0, [0xFF, 0x03, 4, *b'Lead']),
+        (0, [0xC0, 5]),  # program change, one data byte
+        (0, [0x90, 60, 100]),
+        (10, [62, 90]),  # running status note on
+        (5, [60, 0]),  # running status note on with velocity 0 ends the note
+        (200, [0xB0, 7, 100]),  # two-byte delta, controller
+        (0, [64, 90]),  # running status controller, not a note
+        (3, [0xE0, 0x00, 0x40]),  # pitch bend
+        (0, [0xD0, 30]),  # channel pressure, one data byte
+        (0, [0xF0, 3, 0x7E, 0x7F, 0xF7]),  # sysex
+        (0, [0xF7, 2, 0x01, 0x02]),  # sysex escape
+        (0, [0xFF, 0x01, 4, *b'text']),  # meta events keep running status
+        (7, [0x80, 62, 64]),
+        (0, [64, 0]),  # running status note off
+        (16384, [0x9F, 127, 1]),  # three-byte delta, channel 16
+    )
+    tracks = assert_same_columns(write(tmp_path, smf(conductor, notes)))
+    assert tracks[1].name == 'Lead'
+    assert tracks[1].is_on.tolist() == [True, True, False, False, False, True]
+
+
+def test_mido_written_file(tmp_path):
+    mid = mido.MidiFile(ticks_per_beat=96)
+    for channel in range(3):
+        t = mido.MidiTrack()
+        t.append(mido.MetaMessage('track_name', name=f'Track {channel}'))
+        t.append(mido.MetaMessage('set_tempo', tempo=400000 + channel, time=channel))
+        for i in range(50):
+            t.append(mido.Message('note_on', channel=channel, note=40 + i, velocity=1 + i, time=i % 3))
+            t.append(mido.Message('control_change', channel=channel, control=64, value=i, time=0))
+            t.append(mido.Message('note_off', channel=channel, note=40 + i, velocity=i, time=7))
+        mid.tracks.append(t)
+    path = str(tmp_path / 'mido.mid')
+    mid.save(path)
+    assert_same_columns(path)
+
+
+def test_blocks_join_to_the_whole_track(tmp_path):
+    events = [(i % 5, [0x90, 30 + i % 60, 1 + i % 100]) for i in range(3000)]
+    data = smf(track((0, [0xFF, 0x51, 3, 0x07, 0xA1, 0x20]), *events))
+    with smf_reader.mapped(write(tmp_path, data)) as mapped:
+        _, chunks = smf_reader.track_chunks(mapped)
+        start, end = chunks[0]
+        whole = smf_reader.join_blocks([block for _, block in smf_reader.iter_track_blocks(mapped, start, end)])
+        blocks = list(smf_reader.iter_track_blocks(mapped, start, end, block_bytes=100))
+    assert len(blocks) > 1
+    assert [walked for walked, _ in blocks][-1] == end - start
+    joined = smf_reader.join_blocks([block for _, block in blocks])
+    np.testing.assert_array_equal(joined.ticks, whole.ticks)
+    np.testing.assert_array_equal(joined.notes, whole.notes)
+    assert joined.tempo_changes == whole.tempo_changes
+    assert joined.end_tick == whole.end_tick
+
+
+def test_progress_within_a_single_track(tmp_path, monkeypatch):
+    monkeypatch.setattr(midi_core, 'LOAD_PROGRESS_BYTES', 256)
+    data = smf(track(*[(1, [0x90, 60, 100]) for _ in range(1000)]))
+    calls = []
+    smf_reader.read_smf(write(tmp_path, data), progress=lambda *args: calls.append(args))
+    assert len(calls) > 2
+    assert calls[0][2] == 0
+    assert calls[-1] == (len(data), len(data), 1, 1)
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'RIFF' + bytes(20),
+    smf(track((0, [0x90, 60, 100])))[:-3],  # chunk runs past the end of the file
+    smf(track((0, [0x90, 60, 100])), num_tracks=2),  # fewer chunks than the header says
+    smf(track((0, [60, 100]))),  # running status with no status byte before it
+])
+def test_malformed_files(tmp_path, data):
+    with pytest.raises(smf_reader.SMFError):
+        smf_reader.read_smf(write(tmp_path, data))
+
+
+def test_event_running_past_its_chunk(tmp_path):
+    # The note on's data bytes lie in the next chunk
+    short = b'MTrk' + struct.pack('>L', 3) + b'\x00\x90\x3c'
+    data = smf(track()) + short + b'MTrk' + struct.pack('>L', 4) + b'\x64\x00\xff\x2f'
+    data = data[:10] + struct.pack('>h', 3) + data[12:]
+    with pytest.raises(smf_reader.SMFError):
+        smf_reader.read_smf(write(tmp_path, data))
+
+    # Truncated at the end of the file, inside a track's last event
+    truncated = b'MThd' + struct.pack('>Lhhh', 6, 0, 1, 480) + b'MTrk' + struct.pack('>L', 3) + b'\x00\x90\x3c'
+    with pytest.raises(smf_reader.SMFError):
+        smf_reader.read_smf(write(tmp_path, truncated, 'truncated.mid'))
@@ -0,0 +1,36 @@
+"""Single-consumer channel from worker threads to the Tk main loop.
+
+Tk is not thread safe, so worker threads never touch widgets or call
+after() themselves. They publish state snapshots, of which only the latest
+value per key is kept, and post events that must each be delivered. The Tk
+loop drains the channel once per frame.
+"""
+import threading
+from collections import deque
+
+
+class UpdateChannel:
+    """Coalescing snapshots plus an ordered event queue"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latest = {}
+        self.events = deque()
+
+    def publish(self, key, value):
+        """Replace the snapshot for key; unread older values are dropped"""
+        with self.lock:
+            self.latest[key] = value
+
+    def post(self, *event):
+        """Queue an event tuple; every event is delivered in order"""
+        with self.lock:
+            self.events.append(event)
+
+    def drain(self):
+        """Return (latest snapshots, events) and empty the channel"""
+        with self.lock:
+            latest, self.latest = self.latest, {}
+            events = list(self.events)
+            self.events.clear()
+        return latest, events